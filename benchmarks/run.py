@@ -0,0 +1,285 @@
+'''Times moult's scanning phases against a synthetic project.
+
+Usage: python -m benchmarks.run [options]
+
+The results are printed and can be saved as JSON with --output. Passing a
+previous run's JSON file with --compare prints the change for each
+benchmark.
+'''
+from __future__ import print_function, division
+
+import io
+import os
+import gc
+import ast
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+from timeit import default_timer
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from moult import __version__, ast_scanner, filesystem_scanner, program, \
+    utils, cache
+
+from . import synthetic
+
+
+def max_rss():
+    '''Peak resident set size of the process in bytes, or None.
+    '''
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return rss
+    return rss * 1024
+
+
+@contextlib.contextmanager
+def quiet():
+    '''Discards anything written to stdout.
+    '''
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as fp:
+        sys.stdout = fp
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+
+
+def measure(func, setup=None, repeat=3):
+    '''Calls `func` `repeat` times and returns the timings and the peak
+    memory allocated during the calls. `setup` is called before each run
+    and its return value is passed to `func`.
+    '''
+    runs = []
+    peak = None
+
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        gc.collect()
+        if tracemalloc is not None:
+            tracemalloc.start()
+
+        start = default_timer()
+        func(arg)
+        runs.append(default_timer() - start)
+
+        if tracemalloc is not None:
+            peak = max(peak or 0, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+    return {
+        'runs': runs,
+        'best': min(runs),
+        'mean': sum(runs) / len(runs),
+        'peak_memory': peak,
+    }
+
+
+def python_files(directory):
+    files = []
+    for root, dirs, filenames in os.walk(directory):
+        dirs.sort()
+        for filename in sorted(filenames):
+            if filename.endswith('.py'):
+                files.append(os.path.join(root, filename))
+    return files
+
+
+def run_benchmarks(params, repeat=3, jobs=1):
+    root = tempfile.mkdtemp(prefix='moult-bench')
+    site_packages = os.path.join(root, 'site-packages')
+    results = {}
+
+    # The fake site-packages needs to be in sys.path before moult looks for
+    # installed packages or import paths.
+    sys.path.insert(0, site_packages)
+    cache.enabled = False
+
+    try:
+        external = synthetic.generate_site_packages(
+            site_packages, dists=params['dists'], seed=params['seed'])
+        project = synthetic.generate_project(
+            os.path.join(root, 'src'), files=params['files'],
+            depth=params['depth'], branches=params['branches'],
+            imports=params['imports'], relative=params['relative'],
+            dynamic=params['dynamic'], errors=params['errors'],
+            external=external, seed=params['seed'])
+        files = python_files(project)
+
+        def scan_files(_):
+            for filename in files:
+                ast_scanner.ast_scan_file(filename)
+
+        results['ast_scan_file'] = measure(scan_files, repeat=repeat)
+        results['ast_scan_file']['files'] = len(files)
+
+        # The trees are parsed once so only the walks over them are timed.
+        trees = []
+        for filename in files:
+            with io.open(filename, 'rb') as fp:
+                try:
+                    trees.append((filename, ast.parse(fp.read(), filename)))
+                except SyntaxError:
+                    pass
+
+        def walk_trees(_):
+            for filename, root in trees:
+                ast_scanner.ImportNodeVisitor(filename).scan(root)
+
+        results['visitor_scan'] = measure(walk_trees, repeat=repeat)
+        results['visitor_scan']['files'] = len(trees)
+
+        results['installed_packages'] = measure(
+            lambda _: utils.installed_packages(), repeat=repeat)
+        results['installed_packages']['dists'] = params['dists']
+
+        # Rebuilding from records avoids deepcopy's recursion on long
+        # dependency chains.
+        records = utils._dump_installed(utils.installed_packages())
+
+        def fresh_installed():
+            utils.clear_import_cache()
+            return utils._load_installed(records)
+
+        def scan_directory(installed):
+            filesystem_scanner.scan_directory(None, project, set(),
+                                              installed)
+
+        results['scan_directory'] = measure(
+            scan_directory, fresh_installed, repeat=repeat)
+        results['scan_directory']['files'] = len(files)
+
+        if jobs > 1:
+            def parallel_scan(installed):
+                filesystem_scanner.scan(project, installed, jobs=jobs)
+
+            results['scan_parallel'] = measure(
+                parallel_scan, fresh_installed, repeat=repeat)
+            results['scan_parallel']['files'] = len(files)
+            results['scan_parallel']['jobs'] = jobs
+
+        def moult(_):
+            with quiet():
+                program.moult(scan=[project], recursive=True, no_cache=True)
+
+        results['moult'] = measure(moult, utils.clear_import_cache,
+                                   repeat=repeat)
+        results['moult']['files'] = len(files)
+    finally:
+        sys.path.remove(site_packages)
+        shutil.rmtree(root, ignore_errors=True)
+
+    for result in results.values():
+        if 'files' in result:
+            result['files_per_second'] = result['files'] / result['best']
+
+    return {
+        'moult': __version__,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'params': params,
+        'max_rss': max_rss(),
+        'results': results,
+    }
+
+
+def print_results(data, baseline=None):
+    print('moult {moult} on {implementation} {python}'.format(**data))
+    print('{:<20} {:>10} {:>10} {:>12} {:>12}'.format(
+        'benchmark', 'best', 'mean', 'files/s', 'peak mem'))
+
+    for name, result in sorted(data['results'].items()):
+        peak = result.get('peak_memory')
+        line = '{:<20} {:>10.4f} {:>10.4f} {:>12} {:>12}'.format(
+            name, result['best'], result['mean'],
+            '{:.0f}'.format(result['files_per_second'])
+            if 'files_per_second' in result else '-',
+            '{:.1f}M'.format(peak / 1024 / 1024) if peak else '-')
+
+        if baseline:
+            old = baseline['results'].get(name)
+            if old:
+                change = (result['best'] - old['best']) / old['best'] * 100
+                line += ' {:>+8.1f}%'.format(change)
+
+        print(line)
+
+
+def create_argparser():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run',
+                                     description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=500,
+                        help='Number of modules in the project.')
+    parser.add_argument('--depth', type=int, default=3,
+                        help='Depth of the project\'s package tree.')
+    parser.add_argument('--branches', type=int, default=3,
+                        help='Subpackages in each package.')
+    parser.add_argument('--imports', type=int, default=10,
+                        help='Import statements in each module.')
+    parser.add_argument('--relative', type=float, default=0.1,
+                        help='Fraction of imports that are relative.')
+    parser.add_argument('--dynamic', type=float, default=0.05,
+                        help='Fraction of imports that use __import__ or'
+                        ' import_module.')
+    parser.add_argument('--errors', type=float, default=0.01,
+                        help='Fraction of files with syntax errors.')
+    parser.add_argument('--dists', type=int, default=200,
+                        help='Number of dist-info entries in the fake'
+                        ' site-packages.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed for generating the project.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of times each benchmark is run.')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Also time a parallel scan with N processes.')
+    parser.add_argument('-o', '--output', metavar='file',
+                        help='Write the results to a JSON file.')
+    parser.add_argument('--compare', metavar='file',
+                        help='JSON file from a previous run to compare'
+                        ' against.')
+    return parser
+
+
+def main(argv=None):
+    args = create_argparser().parse_args(argv)
+    params = dict((k, getattr(args, k)) for k in (
+        'files', 'depth', 'branches', 'imports', 'relative', 'dynamic',
+        'errors', 'dists', 'seed'))
+
+    data = run_benchmarks(params, repeat=args.repeat, jobs=args.jobs)
+
+    baseline = None
+    if args.compare:
+        with io.open(args.compare, 'rt', encoding='utf8') as fp:
+            baseline = json.load(fp)
+        if baseline.get('params') != params:
+            print('Warning: comparing runs with different parameters',
+                  file=sys.stderr)
+
+    print_results(data, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(data, fp, indent=2, sort_keys=True)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
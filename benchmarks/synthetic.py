@@ -0,0 +1,148 @@
+'''Generates synthetic projects and site-packages directories for the
+benchmarks.
+'''
+from __future__ import division, unicode_literals
+
+import io
+import os
+import random
+
+
+# Standard library modules that are sprinkled into the generated imports
+stdlib_modules = ('os', 're', 'sys', 'json', 'time', 'logging', 'hashlib',
+                  'itertools', 'functools', 'collections', 'subprocess',
+                  'tempfile', 'datetime', 'socket', 'struct', 'random')
+
+
+def _write(filename, text):
+    dirname = os.path.dirname(filename)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    with io.open(filename, 'wt', encoding='utf8') as fp:
+        fp.write(text)
+
+
+def dist_name(i):
+    return 'benchpkg{}'.format(i)
+
+
+def generate_site_packages(root, dists=200, requires=3, seed=0):
+    '''Creates a site-packages directory in `root` with `dists` dist-info
+    entries. Each distribution has an importable package and requires up to
+    `requires` distributions that come before it.
+
+    Returns the names of the importable packages.
+    '''
+    rand = random.Random(seed)
+    names = []
+
+    for i in range(dists):
+        name = dist_name(i)
+        info = os.path.join(root, '{}-1.0.dist-info'.format(name))
+
+        metadata = ['Metadata-Version: 2.1', 'Name: {}'.format(name),
+                    'Version: 1.0']
+        for dep in rand.sample(names, min(len(names), requires)):
+            metadata.append('Requires-Dist: {} (>=1.0)'.format(dep))
+        _write(os.path.join(info, 'METADATA'), '\n'.join(metadata) + '\n')
+
+        _write(os.path.join(info, 'top_level.txt'), name + '\n')
+        _write(os.path.join(info, 'RECORD'), '\n'.join((
+            '{}/__init__.py,,'.format(name),
+            '{}-1.0.dist-info/METADATA,,'.format(name),
+            '{}-1.0.dist-info/RECORD,,'.format(name),
+        )) + '\n')
+        _write(os.path.join(root, name, '__init__.py'), '')
+
+        names.append(name)
+
+    return names
+
+
+def _module_names(files, depth, branches):
+    '''Lays out `files` module paths in a package tree that's `depth` levels
+    deep. Each package gets `branches` subpackages.
+    '''
+    packages = [('project',)]
+    level = packages
+    for _ in range(depth - 1):
+        level = [p + ('pkg{}'.format(i),) for p in level
+                 for i in range(branches)]
+        packages.extend(level)
+
+    modules = []
+    for i in range(files):
+        package = packages[i % len(packages)]
+        modules.append(package + ('module{}'.format(i),))
+    return packages, modules
+
+
+def _import_line(rand, modules, external, relative, dynamic):
+    r = rand.random()
+    if r < dynamic:
+        target = rand.choice(external or stdlib_modules)
+        if rand.random() < 0.5:
+            return 'name = {!r}\n__import__(name)'.format(str(target))
+        return 'import importlib\nimportlib.import_module({!r})'.format(
+            str(target))
+
+    if rand.random() < relative:
+        sibling = rand.choice(modules)
+        return 'from . import {}'.format(sibling[-1])
+
+    pool = rand.choice((stdlib_modules, external, modules))
+    if not pool:
+        pool = stdlib_modules
+    target = rand.choice(pool)
+    if isinstance(target, tuple):
+        return 'from {} import {}'.format('.'.join(target[:-1]), target[-1])
+    if rand.random() < 0.5:
+        return 'import {}'.format(target)
+    return 'from {} import spam, eggs'.format(target)
+
+
+def generate_project(root, files=500, depth=3, branches=3, imports=10,
+                     relative=0.1, dynamic=0.05, errors=0.01, external=None,
+                     seed=0):
+    '''Creates a project in `root` with `files` modules spread over a package
+    tree that's `depth` levels deep.
+
+    Each module has `imports` import statements. `relative` and `dynamic`
+    are the fractions of imports that are relative or done through
+    `__import__` or `importlib.import_module`. `errors` is the fraction of
+    files with syntax errors, which makes the scanner fall back to regex.
+    `external` is a list of installed package names that can be imported.
+
+    Returns the project's directory.
+    '''
+    rand = random.Random(seed)
+    external = list(external or [])
+    packages, modules = _module_names(files, depth, branches)
+    project = os.path.join(root, 'project')
+
+    for package in packages:
+        _write(os.path.join(root, *package) + os.sep + '__init__.py', '')
+
+    for module in modules:
+        lines = ['"""Synthetic module {}."""'.format('.'.join(module))]
+        for _ in range(imports):
+            lines.append(_import_line(rand, modules, external,
+                                      relative, dynamic))
+
+        lines.append('')
+        lines.append('')
+        lines.append('def function(arg):')
+        lines.append('    value = arg * 2')
+        lines.append('    return value')
+        lines.append('')
+        lines.append('')
+        lines.append('class Thing(object):')
+        lines.append('    def method(self):')
+        lines.append('        return function(1)')
+
+        if rand.random() < errors:
+            lines.append('    def broken(:')
+
+        _write(os.path.join(root, *module) + '.py', '\n'.join(lines) + '\n')
+
+    return project
@@ -76,6 +76,59 @@ underscore so you are less likely to uninstall them on accident.'''
                         dest='detail', help='Display detailed package'
                         ' dependencies.')
 
+    parser.add_argument('--format', choices=('text', 'ndjson', 'json'),
+                        default='text', required=False, dest='output_format',
+                        help='Output format. ndjson writes a JSON record for'
+                        ' each module, edge, and result as soon as it\'s'
+                        ' found, and json writes the same records as an'
+                        ' array.')
+
+    parser.add_argument('-j', '--jobs', metavar='N', type=int, default=1,
+                        required=False, dest='jobs', help='Number of'
+                        ' processes used to parse files when scanning'
+                        ' directories. Use 0 for one process per CPU.')
+
+    parser.add_argument('--threads', action='store_true', required=False,
+                        dest='threads', help='Use threads instead of'
+                        ' processes for -j.')
+
+    parser.add_argument('-w', '--watch', action='store_true', required=False,
+                        dest='watch', help='Keep watching the scanned'
+                        ' directories and print the packages that are newly'
+                        ' imported or no longer used as files change.')
+
+    parser.add_argument('--interval', metavar='seconds', type=float,
+                        default=1.0, required=False, dest='interval',
+                        help='How often --watch checks for changes.'
+                        ' Defaults to 1 second.')
+
+    parser.add_argument('--no-cache', action='store_true', required=False,
+                        dest='no_cache', help='Don\'t use or update the cache'
+                        ' of file scan results.')
+
+    parser.add_argument('--cache-dir', metavar='dir', required=False,
+                        dest='cache_dir', help='Directory for storing cached'
+                        ' scan results. Defaults to ~/.cache/moult.')
+
+    parser.add_argument('--baseline', metavar='file', required=False,
+                        dest='baseline', help='Saved scan results used to'
+                        ' only scan the files in directories that changed'
+                        ' since the last run. The file is created if it'
+                        ' doesn\'t exist and updated after the scan.')
+
+    parser.add_argument('--since', metavar='ref', required=False,
+                        dest='since', help='Use git to find the files that'
+                        ' changed since a commit when using --baseline,'
+                        ' instead of modification times.')
+
+    parser.add_argument('--profile', action='store_true', required=False,
+                        dest='profile', help='Print the time spent in each'
+                        ' phase of the run to stderr.')
+
+    parser.add_argument('--profile-json', metavar='file', required=False,
+                        dest='profile_json', help='Write the profile to a'
+                        ' JSON file.')
+
     color = parser.add_mutually_exclusive_group()
 
     color.add_argument('--no-color', action='store_true',
@@ -87,3 +140,73 @@ underscore so you are less likely to uninstall them on accident.'''
                        help='The classier way to disable colored output.')
 
     return parser
+
+
+def create_daemon_argparser():
+    import argparse
+
+    common = argparse.ArgumentParser(add_help=False)
+
+    common.add_argument('--socket', metavar='path', required=False,
+                        dest='socket', help='Unix socket the daemon listens'
+                        ' on. Defaults to a socket in the cache directory.')
+
+    common.add_argument('--no-cache', action='store_true', required=False,
+                        dest='no_cache', help='Don\'t use or update the cache'
+                        ' of file scan results.')
+
+    parser = argparse.ArgumentParser(prog='moult', description='Keeps'
+                                     ' installed packages and scans in'
+                                     ' memory to answer queries quickly.')
+
+    commands = parser.add_subparsers(dest='command')
+
+    daemon = commands.add_parser('daemon', parents=[common],
+                                 help='Run the daemon in the foreground.')
+
+    daemon.add_argument('-l', action='store_true', required=False,
+                        dest='local', help='Only load local modules.')
+
+    daemon.add_argument('--max-scans', metavar='N', type=int, required=False,
+                        dest='max_scans', help='Number of scanned files and'
+                        ' directories to keep in memory. Defaults to 32.')
+
+    query = commands.add_parser('query', parents=[common], help='Send a'
+                                ' query to the daemon. The query is answered without the daemon'
+                                ' if it isn\'t running.')
+
+    query.add_argument('query', choices=('ping', 'scan', 'freeze',
+                                         'removable', 'stop'),
+                       help='The query to send.')
+
+    query.add_argument('paths', metavar='path', nargs='*',
+                       help='Files or directories to scan. Defaults to the'
+                       ' current directory.')
+
+    query.add_argument('-a', action='store_true', required=False,
+                       dest='show_all', help='Include hidden packages in'
+                       ' removable packages.')
+
+    query.add_argument('-r', action='store_true', required=False,
+                       dest='recursive', help='Recursively find removable'
+                       ' packages.')
+
+    query.add_argument('--no-daemon', action='store_true', required=False,
+                       dest='no_daemon', help='Answer the query without'
+                       ' the daemon.')
+
+    return parser
+
+
+def parse_daemon_args(argv):
+    '''Parses the arguments for the daemon commands. argparse stops reading
+    a query's paths at the first flag, so the paths after the flags are
+    added to the ones before them.
+    '''
+    parser = create_daemon_argparser()
+    args, extra = parser.parse_known_args(argv)
+    if extra:
+        if args.command != 'query' or any(x.startswith('-') for x in extra):
+            parser.error('unrecognized arguments: {}'.format(' '.join(extra)))
+        args.paths.extend(extra)
+    return args
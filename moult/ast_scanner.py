@@ -1,12 +1,15 @@
 from __future__ import unicode_literals
 
 import io
+import os
 import re
+import sys
 import ast
+import mmap
 
 from .exceptions import MoultScannerError
-from .compat import str_
-from . import utils, log
+from .compat import PY3, str_
+from . import utils, log, stats
 
 
 _fallback_re = re.compile(r'''
@@ -18,6 +21,85 @@ _fallback_re = re.compile(r'''
     )
 ''', re.VERBOSE | re.MULTILINE | re.UNICODE)
 
+_paren_table = dict((ord(x), None) for x in '()')
+
+
+def _fallback_imports(script):
+    '''Yields the text of the import statements `_fallback_re` finds in
+    `script`. The pattern is only tried on the lines that contain `import`,
+    which is much faster than letting it try every line.
+    '''
+    end = 0
+    tried = -1
+    i = script.find('import')
+    while i != -1:
+        start = script.rfind('\n', 0, i) + 1
+        if start >= end and start != tried:
+            tried = start
+            m = _fallback_re.match(script, start)
+            if m is not None:
+                end = m.end()
+                yield m.group(1)
+        i = script.find('import', max(i + 6, end))
+
+
+# Python 3.8+ parses all literals to this
+_Constant = getattr(ast, 'Constant', None) if sys.version_info >= (3, 8) else None
+
+# Files without any of these can't have imports the scanner would find.
+# `import` also covers `__import__` and `import_module`. `INSTALLED_APPS`
+# keeps Django settings in the scope.
+_prefilter_tokens = (b'import', b'INSTALLED_APPS')
+
+# Files at least this big are searched through mmap before they're read
+mmap_threshold = 1024 * 256
+
+
+def may_have_imports(data):
+    '''Checks the raw bytes of a file, or an mmap of it, for the tokens in
+    `_prefilter_tokens`.
+    '''
+    for token in _prefilter_tokens:
+        if data.find(token) != -1:
+            return True
+    return False
+
+
+def _prefilter(fp, digest=None):
+    '''Returns the file's contents, or None if the file can't have imports.
+    Big files are only read if they might have imports. The contents are
+    added to `digest` if it's given.
+    '''
+    size = os.fstat(fp.fileno()).st_size
+    if size >= mmap_threshold:
+        try:
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, EnvironmentError):
+            data = None
+        if data is not None:
+            try:
+                if not may_have_imports(data):
+                    if digest is not None:
+                        digest.update(data)
+                    stats.incr('prefilter.misses')
+                    return None
+            finally:
+                data.close()
+            stats.incr('prefilter.hits')
+            source = fp.read()
+            if digest is not None:
+                digest.update(source)
+            return source
+
+    source = fp.read()
+    if digest is not None:
+        digest.update(source)
+    if not may_have_imports(source):
+        stats.incr('prefilter.misses')
+        return None
+    stats.incr('prefilter.hits')
+    return source
+
 
 def ast_value(val, scope, return_name=False):
     '''Recursively parse out an AST value.  This makes no attempt to load
@@ -26,6 +108,18 @@ def ast_value(val, scope, return_name=False):
     '''
     # :TODO: refactor the hell out of this
     try:
+        if type(val) is _Constant:
+            # Same as the ast.Num, ast.Str and ast.Bytes checks below, which
+            # are slow on Python 3.8+
+            value = val.value
+            if isinstance(value, bool):
+                return None
+            if isinstance(value, bytes):
+                return bytes(value)
+            if isinstance(value, (int, float, complex, str_)):
+                return value
+            return None
+
         if isinstance(val, (ast.Assign, ast.Delete)):
             if hasattr(val, 'value'):
                 value = ast_value(val.value, scope)
@@ -144,11 +238,20 @@ def parse_programmatic_import(node, scope):
     if not name:
         return []
 
+    # Python 3.5+ doesn't have the starargs and kwargs fields
     args, kwargs = flatten_call_args(ast_value(node.args, scope),
                                      ast_value(node.keywords, scope),
-                                     ast_value(node.starargs, scope),
-                                     ast_value(node.kwargs, scope))
+                                     ast_value(getattr(node, 'starargs', None), scope),
+                                     ast_value(getattr(node, 'kwargs', None), scope))
+
+    return programmatic_imports(name, args, kwargs)
 
+
+def programmatic_imports(name, args, kwargs):
+    '''Returns the imports made by a call to a function named `name` with
+    the resolved `args` and `kwargs`, if it's `__import__` or
+    `import_module`.
+    '''
     imports = []
 
     if name.endswith('__import__'):
@@ -181,24 +284,44 @@ class ResolvedImport(object):
         module = import_path.split('.', 1)[0]
         self.module = module
         self.import_path = import_path
+        self.import_root = import_root
         self.is_stdlib = utils.is_stdlib(module)
-        self.filename = None
-
-        if not self.is_stdlib:
-            self.filename = utils.file_containing_import(import_path, import_root)
+        self._filename = None
+        self._resolved = self.is_stdlib
+
+    @property
+    def filename(self):
+        '''The file containing the import. It's only looked up when needed
+        since it takes a lot of filesystem checks to find.
+        '''
+        if not self._resolved:
+            self._filename = utils.file_containing_import(self.import_path,
+                                                          self.import_root)
+            self._resolved = True
+        return self._filename
 
     def __repr__(self):
         return '<ResolvedImport {} ({})>'.format(self.import_path, self.filename)
 
 
-class ImportNodeVisitor(ast.NodeVisitor):
+# Fields of statements that contain other statements, in the order they
+# appear in the nodes' `_fields`.
+_body_fields = ('body', 'handlers', 'orelse', 'finalbody', 'cases')
+
+
+class ImportNodeVisitor(object):
     '''A simplistic AST visitor that looks for easily identified imports.
 
-    It can resolve simple assignment variables defined within the module.
+    It can resolve simple assignment variables defined within the module. A
+    visitor holds the state for the file it was created for, so a new one is
+    needed for every scan.
     '''
-    def reset(self, filename):
+    def __init__(self, filename):
         self.filename = filename
         self.import_path, self.import_root = utils.import_path_from_file(filename)
+        self._imports = set()
+        self.imports = []
+        self.scope = {}
 
     def add_import(self, *names):
         for module, name in names:
@@ -211,108 +334,113 @@ class ImportNodeVisitor(ast.NodeVisitor):
                 self._imports.add(module)
                 self.imports.append(ResolvedImport(module, self.import_root))
 
-    def visit_Module(self, node):
-        log.debug('Resetting AST visitor with module path: %s', self.import_path)
-        self._imports = set()
-        self.imports = []
-        self.scope = {}
-        if node:
-            self.generic_visit(node)
-
-    def visit_Import(self, node):
-        for n in node.names:
-            self.add_import((n.name, ''))
-        self.generic_visit(node)
-
-    def visit_ImportFrom(self, node):
-        module = '{}{}'.format('.' * node.level, str_(node.module or ''))
-        for n in node.names:
-            self.add_import((module, n.name))
-        self.generic_visit(node)
-
-    def visit_Expr(self, node):
-        if isinstance(node.value, ast.Call):
-            try:
-                self.add_import(*parse_programmatic_import(node.value, self.scope))
-            except MoultScannerError as e:
-                log.debug('%s, File: %s', e, self.filename)
-        elif isinstance(node.value, ast.Name):
-            ast_value(node.value, self.scope)
-        self.generic_visit(node)
-
-    def visit_Assign(self, node):
-        ast_value(node, self.scope)
-
-    def visit_Delete(self, node):
-        ast_value(node, self.scope)
-
-    def visit(self, node):
-        super(ImportNodeVisitor, self).visit(node)
-
-
-ast_visitor = ImportNodeVisitor()
-
+    def scan(self, root):
+        '''Walks a module's statements without recursion. Imports and
+        assignments are statements and expressions can't contain
+        statements, so the expressions in the tree are never walked.
+        '''
+        log.debug('Visiting module with path: %s', self.import_path)
+        stack = list(reversed(getattr(root, 'body', None) or []))
+        while stack:
+            node = stack.pop()
+            node_type = type(node)
+
+            if node_type is ast.Import:
+                for n in node.names:
+                    self.add_import((n.name, ''))
+            elif node_type is ast.ImportFrom:
+                module = '{}{}'.format('.' * node.level, str_(node.module or ''))
+                for n in node.names:
+                    self.add_import((module, n.name))
+            elif node_type is ast.Expr:
+                if isinstance(node.value, ast.Call):
+                    try:
+                        self.add_import(*parse_programmatic_import(node.value, self.scope))
+                    except MoultScannerError as e:
+                        log.debug('%s, File: %s', e, self.filename)
+            elif node_type is ast.Assign or node_type is ast.Delete:
+                ast_value(node, self.scope)
+            else:
+                children = []
+                for field in _body_fields:
+                    value = getattr(node, field, None)
+                    if value and isinstance(value, list):
+                        children.extend(value)
+                stack.extend(reversed(children))
 
-def _ast_scan_file_re(filename):
-    try:
-        with io.open(filename, 'rt', encoding='utf8') as fp:
-            script = fp.read()
-            normalized = ''
-            for imp in _fallback_re.finditer(script):
-                imp_line = imp.group(1)
-                try:
-                    imp_line = imp_line.decode('utf8')
-                except AttributeError:
-                    pass
-                except UnicodeEncodeError:
-                    log.warn('Unicode import failed: %s', imp_line)
-                    continue
-                imp_line = re.sub(r'[\(\)]', '', imp_line)
-                normalized += ' '.join(imp_line.split()).strip(',') + '\n'
-            log.debug('Normalized imports:\n%s', normalized)
 
+def _ast_scan_file_re(filename, source):
+    '''Scans the raw `source` of a file that can't be parsed by parsing only
+    the lines that look like imports.
+    '''
+    stats.incr('parse.regex_fallback')
+    script = source.decode('utf8', 'replace')
+    if '\r' in script:
+        script = script.replace('\r\n', '\n').replace('\r', '\n')
+
+    lines = []
+    for imp_line in _fallback_imports(script):
+        if not PY3:
+            # Python 2 only has ASCII identifiers
             try:
-                root = ast.parse(normalized, filename=filename)
-            except SyntaxError:
-                log.error('Could not parse file using regex scan: %s', filename)
-                log.info('Exception:', exc_info=True)
-                return None, None
+                imp_line.encode('ascii')
+            except UnicodeEncodeError:
+                log.warn('Unicode import failed: %s', imp_line)
+                continue
+        imp_line = imp_line.translate(_paren_table)
+        lines.append(' '.join(imp_line.split()).strip(','))
+    normalized = '\n'.join(lines) + '\n'
+    log.debug('Normalized imports:\n%s', normalized)
 
-            log.debug('Starting AST Scan (regex): %s', filename)
-            ast_visitor.reset(filename)
-            ast_visitor.visit(root)
-            return ast_visitor.scope, ast_visitor.imports
-    except IOError:
-        log.warn('Could not open file: %s', filename)
+    try:
+        with stats.timer('parse'):
+            root = ast.parse(normalized, filename=filename)
+    except SyntaxError:
+        log.error('Could not parse file using regex scan: %s', filename)
+        log.info('Exception:', exc_info=True)
+        return None, None
 
-    return None, None
+    log.debug('Starting AST Scan (regex): %s', filename)
+    with stats.timer('visit'):
+        visitor = ImportNodeVisitor(filename)
+        visitor.scan(root)
+    return visitor.scope, visitor.imports
 
 
-def ast_scan_file(filename, re_fallback=True):
+def ast_scan_file(filename, re_fallback=True, digest=None):
     '''Scans a file for imports using AST.
 
     In addition to normal imports, try to get imports via `__import__`
     or `import_module` calls. The AST parser should be able to resolve
     simple variable assignments in cases where these functions are called
     with variables instead of strings.
+
+    The file's contents are added to `digest`, a hashlib object, if it's
+    given.
     '''
     try:
         with io.open(filename, 'rb') as fp:
+            source = _prefilter(fp, digest)
+            if source is None:
+                log.debug('No imports in: %s', filename)
+                return {}, []
             try:
-                root = ast.parse(fp.read(), filename=filename)
+                with stats.timer('parse'):
+                    root = ast.parse(source, filename=filename)
             except (SyntaxError, IndentationError):
                 if re_fallback:
                     log.debug('Falling back to regex scanner')
-                    return _ast_scan_file_re(filename)
+                    return _ast_scan_file_re(filename, source)
                 else:
                     log.error('Could not parse file: %s', filename)
                     log.info('Exception:', exc_info=True)
                 return None, None
             log.debug('Starting AST Scan: %s', filename)
-            ast_visitor.reset(filename)
-            ast_visitor.visit(root)
-            log.debug('Project path: %s', ast_visitor.import_root)
-            return ast_visitor.scope, ast_visitor.imports
+            with stats.timer('visit'):
+                visitor = ImportNodeVisitor(filename)
+                visitor.scan(root)
+            log.debug('Project path: %s', visitor.import_root)
+            return visitor.scope, visitor.imports
     except IOError:
         log.warn('Could not open file: %s', filename)
 
@@ -0,0 +1,312 @@
+'''Incremental scans that only parse the files that changed since a saved
+baseline.
+
+A baseline records the imports found in each file of a scanned directory,
+along with the sizes and modification times of the files and directories.
+Changes are found with git when a ref is supplied, or by comparing
+modification times otherwise. Only the changed files are parsed, and the
+scanned module's dependencies are rebuilt from the recorded imports.
+'''
+from __future__ import unicode_literals
+
+import io
+import os
+import json
+import subprocess
+
+from . import filesystem_scanner, cache, utils, log
+
+
+format_version = 1
+
+
+class Baseline(object):
+    '''The scan results for each scanned directory. Paths are stored relative
+    to the scanned directory so the baseline can be used from a different
+    checkout.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.roots = {}
+
+    def load(self):
+        try:
+            with io.open(self.filename, 'rt', encoding='utf8') as fp:
+                data = json.load(fp)
+        except (IOError, OSError, ValueError):
+            return self
+
+        if isinstance(data, dict) and data.get('version') == format_version:
+            self.roots = data.get('roots', {})
+        else:
+            log.warn('Ignoring baseline with an unknown format: %s',
+                     self.filename)
+        return self
+
+    def save(self):
+        data = {'version': format_version, 'roots': self.roots}
+        return cache.write_json(self.filename, data, indent=1,
+                                sort_keys=True, separators=(',', ': '))
+
+
+def _run_git(directory, *args):
+    try:
+        proc = subprocess.Popen(('git',) + args, cwd=directory,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+    except OSError:
+        return None
+    out, _ = proc.communicate()
+    if proc.returncode != 0:
+        return None
+    return out.decode('utf8').splitlines()
+
+
+def git_changes(directory, ref):
+    '''Returns the paths under `directory` that changed since `ref`,
+    including untracked files, or None if git couldn't tell. Renamed files
+    are listed under both their old and new paths.
+    '''
+    changed = _run_git(directory, 'diff', '--name-only', '--no-renames',
+                       '--relative', ref, '--', '.')
+    untracked = _run_git(directory, 'ls-files', '--others',
+                         '--exclude-standard', '--', '.')
+    if changed is None or untracked is None:
+        return None
+    return [os.path.join(directory, x) for x in changed + untracked if x]
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _is_scanned(directory, rel):
+    '''Checks if a file would be found by walking `directory`.
+    '''
+    path = os.path.join(directory, rel)
+    parent = os.path.dirname(rel)
+    if parent:
+        depth = len(parent.split(os.sep))
+        if depth >= filesystem_scanner.max_directory_depth \
+                or filesystem_scanner._dir_ignore.search(os.path.dirname(path)):
+            return False
+    return not filesystem_scanner._ext_ignore.search(path)
+
+
+def _walk(directory, directories, sentinel, depth=0):
+    '''Yields the python files in a directory the same way a scan would find
+    them, and records the modification times of the directories.
+    '''
+    directories[directory] = _mtime(directory)
+    for entry in filesystem_scanner._scan_directory(directory, sentinel, depth):
+        if entry.is_dir():
+            for filename in _walk(entry.path, directories, sentinel, depth + 1):
+                yield filename
+        elif utils.is_python_script(entry.path):
+            yield entry.path
+
+
+def scan_file(filename, prescanned=None):
+    '''Scans a file and returns a dict that maps it and the files found
+    through it, such as Django apps, to their import types and paths. The
+    results are added to an entry with `record`. `prescanned` is the result
+    of `filesystem_scanner.prescan`.
+    '''
+    results = {}
+    pending = [filename]
+    sentinel = set()
+
+    while pending:
+        filename = pending.pop()
+        if filename in results:
+            continue
+
+        items = results[filename] = []
+        try:
+            scanned = list(filesystem_scanner._scan_file(filename, sentinel,
+                                                         prescanned=prescanned))
+        except OSError:
+            continue
+
+        for imp_type, import_path, extra_file_scan in scanned:
+            items.append([imp_type, import_path])
+            if not extra_file_scan:
+                continue
+
+            related = utils.file_containing_import(import_path,
+                                                   extra_file_scan)
+            if not related:
+                continue
+            log.info('Related scan: %s - %s', import_path, related)
+            if related.endswith('__init__.py'):
+                pending.extend(_walk(os.path.dirname(related), {}, set()))
+            else:
+                pending.append(related)
+
+    return results
+
+
+def find_changes(directory, entry, ref=None):
+    '''Returns a tuple of the changed and the deleted files in a baseline
+    entry, as sets of paths relative to `directory`. `ref` is a git ref to
+    find the changes with, otherwise modification times are compared. The
+    directories in the entry are updated, but not the files.
+    '''
+    files = entry['files']
+    directories = entry['directories']
+    changed = set()
+    deleted = set()
+
+    paths = None
+    if ref:
+        paths = git_changes(directory, ref)
+        if paths is None:
+            log.warn('Could not get changes from git, using modification '
+                     'times instead: %s', directory)
+
+    if paths is not None:
+        for path in paths:
+            rel = os.path.relpath(path, directory)
+            if not _is_scanned(directory, rel):
+                continue
+            if os.path.isfile(path) and utils.is_python_script(path):
+                changed.add(rel)
+            elif rel in files:
+                deleted.add(rel)
+
+        # Untracked files that were recorded and then deleted aren't listed
+        # by git at all
+        for rel in files:
+            if rel not in changed and rel not in deleted \
+                    and not os.path.isfile(os.path.join(directory, rel)):
+                deleted.add(rel)
+        return changed, deleted
+
+    for rel, (size, mtime, _) in files.items():
+        try:
+            st = os.stat(os.path.join(directory, rel))
+        except OSError:
+            deleted.add(rel)
+            continue
+        if st.st_size != size or st.st_mtime != mtime:
+            changed.add(rel)
+
+    # Only directories that were modified can have new files
+    for rel, mtime in list(directories.items()):
+        path = os.path.normpath(os.path.join(directory, rel))
+        new_mtime = _mtime(path)
+        if new_mtime is None:
+            del directories[rel]
+            continue
+        if new_mtime == mtime:
+            continue
+
+        directories[rel] = new_mtime
+        sentinel = set()
+        for e in filesystem_scanner._scan_directory(path, sentinel):
+            if e.is_dir():
+                dirrel = os.path.relpath(e.path, directory)
+                if dirrel in directories:
+                    continue
+                found = {}
+                for filename in _walk(e.path, found, sentinel):
+                    changed.add(os.path.relpath(filename, directory))
+                for d, m in found.items():
+                    directories[os.path.relpath(d, directory)] = m
+            elif utils.is_python_script(e.path):
+                rel_file = os.path.relpath(e.path, directory)
+                if rel_file not in files:
+                    changed.add(rel_file)
+
+    return changed, deleted
+
+
+def record(directory, entry, results):
+    '''Adds the results of `scan_file` to the files of an entry, along with
+    their current sizes and modification times.
+    '''
+    for filename, items in results.items():
+        try:
+            st = os.stat(filename)
+        except OSError:
+            continue
+        entry['files'][os.path.relpath(filename, directory)] = \
+            [st.st_size, st.st_mtime, items]
+
+
+def _update(directory, entry, ref=None, jobs=1, threads=False):
+    changed, deleted = find_changes(directory, entry, ref)
+    log.info('Baseline changes in %s: %d changed, %d deleted', directory,
+             len(changed), len(deleted))
+
+    for rel in deleted:
+        entry['files'].pop(rel, None)
+
+    filenames = [os.path.join(directory, x) for x in sorted(changed)]
+    prescanned = None
+    if jobs > 1 and len(filenames) > 1:
+        prescanned = filesystem_scanner.prescan(filenames, jobs, threads)
+
+    for filename in filenames:
+        record(directory, entry, scan_file(filename, prescanned))
+
+
+def create_entry(directory, jobs=1, threads=False):
+    '''Scans all of a directory and returns a new baseline entry. The entry
+    has the `files` that were scanned, mapped to their sizes, modification
+    times and `scan_file` results, and the modification times of the
+    `directories`.
+    '''
+    directories = {}
+    filenames = list(_walk(directory, directories, set()))
+
+    prescanned = None
+    if jobs > 1:
+        prescanned = filesystem_scanner.prescan(filenames, jobs, threads)
+
+    entry = {
+        'directories': dict((os.path.relpath(d, directory), m)
+                            for d, m in directories.items()),
+        'files': {},
+    }
+    for filename in filenames:
+        record(directory, entry, scan_file(filename, prescanned))
+    return entry
+
+
+def scan(directory, installed, baseline, key=None, ref=None, jobs=1,
+         threads=False):
+    '''Scans a directory using the results saved in `baseline`, and updates
+    them. `key` is the name the directory is saved under, which defaults to
+    the directory. `ref` is a git ref that the baseline was made at.
+
+    Returns the scanned directory's PyModule.
+    '''
+    directory = os.path.abspath(directory)
+    if key is None:
+        key = directory
+
+    entry = baseline.roots.get(key)
+    if entry is None:
+        log.info('Creating baseline for: %s', directory)
+        entry = create_entry(directory, jobs, threads)
+    else:
+        _update(directory, entry, ref, jobs, threads)
+
+    baseline.roots[key] = entry
+
+    pym = filesystem_scanner.scan_module(directory, installed)
+    for rel in sorted(entry['files']):
+        for imp_type, import_path in entry['files'][rel][2]:
+            dep = utils.find_package(import_path, installed)
+            if dep:
+                dep.add_dependant(pym)
+                pym.add_dependency(dep)
+
+                if imp_type != 'import':
+                    pym.add_framework(imp_type)
+
+    return pym
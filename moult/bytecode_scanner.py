@@ -0,0 +1,340 @@
+'''Reads imports from the compiled bytecode of up to date .pyc files.
+
+Only .pyc files written by the running interpreter are used, and only if
+the source's modification time and size (or hash) match the ones recorded
+in the .pyc file's header. Imports are found in the `IMPORT_NAME`
+instructions of the module and the code objects nested in it. Nested code
+objects are only decoded if they could contain imports. `__import__` and
+`import_module` calls are only read if they're statements that only have
+constant arguments. Anything else returns None so the file is parsed with
+`ast_scanner` instead.
+
+The scope only has the names stored by module level code. The compiler
+removes code behind constant conditions like `if False:`, so files with
+anything that looks like one are parsed instead. Otherwise the imports
+found in a file would depend on whether or not it was compiled.
+'''
+from __future__ import unicode_literals
+
+import io
+import os
+import re
+import sys
+import dis
+import types
+import marshal
+import struct
+
+from .ast_scanner import ImportNodeVisitor, programmatic_imports
+from .exceptions import MoultScannerError
+from . import log, stats
+
+try:
+    from importlib.util import MAGIC_NUMBER, cache_from_source
+except ImportError:
+    import imp
+    MAGIC_NUMBER = imp.get_magic()
+    cache_from_source = getattr(imp, 'cache_from_source', None)
+
+try:
+    from importlib.util import source_hash
+except ImportError:
+    source_hash = None
+
+
+enabled = True
+
+_import_functions = ('__import__', 'import_module')
+
+# Conditions the compiler can remove code for. It's fine if this matches
+# more than it needs to, like in strings, since those files are parsed.
+_constant_guard_re = re.compile(br'''
+    ^[ \t]*(?:
+        (?:el)?if[ \t(]+(?:not[ \t(]+)?(?:False|True|None|0|1|__debug__)|
+        while[ \t(]+(?:not[ \t(]+)?(?:False|None|0|__debug__)
+    )[ \t)]*:
+''', re.VERBOSE | re.MULTILINE)
+
+
+def _opcodes(*names):
+    return frozenset(dis.opmap[x] for x in names if x in dis.opmap)
+
+
+_IMPORT_NAME = dis.opmap['IMPORT_NAME']
+_POP_TOP = dis.opmap['POP_TOP']
+_EXTENDED_ARG = dis.EXTENDED_ARG
+_CACHE = dis.opmap.get('CACHE')
+_LOAD_SMALL_INT = dis.opmap.get('LOAD_SMALL_INT')
+_const_ops = _opcodes('LOAD_CONST', 'LOAD_SMALL_INT')
+_load_ops = _opcodes('LOAD_NAME', 'LOAD_GLOBAL', 'LOAD_ATTR', 'LOAD_METHOD')
+_skip_ops = _opcodes('PUSH_NULL', 'PRECALL', 'NOP')
+_call_ops = frozenset(op for name, op in dis.opmap.items()
+                      if name.startswith('CALL'))
+_store_ops = _opcodes('STORE_NAME', 'STORE_GLOBAL')
+_delete_ops = _opcodes('DELETE_NAME', 'DELETE_GLOBAL')
+_name_ops = _load_ops | _store_ops | _delete_ops | set([_IMPORT_NAME])
+
+# Newer interpreters store flags in the low bits of some name arguments
+_name_shift = {}
+if sys.version_info >= (3, 11):
+    _name_shift[dis.opmap['LOAD_GLOBAL']] = 1
+if sys.version_info >= (3, 12):
+    _name_shift[dis.opmap['LOAD_ATTR']] = 1
+
+_wordcode = sys.version_info >= (3, 6)
+
+
+def pyc_filename(filename):
+    '''Returns the file the interpreter would compile a source file to.
+    '''
+    if not filename.endswith('.py'):
+        return None
+    if cache_from_source is None:
+        return filename + 'c'
+    try:
+        return cache_from_source(filename)
+    except NotImplementedError:
+        return None
+
+
+def _source_stamp(st):
+    '''The source modification time and size as they're stored in a .pyc
+    file's header.
+    '''
+    return struct.pack('<II', int(st.st_mtime) & 0xFFFFFFFF,
+                       st.st_size & 0xFFFFFFFF)
+
+
+def _read_code(pyc, source, st):
+    '''Returns the code object in `pyc` if it was compiled from `source`,
+    which has the stat result `st`.
+    '''
+    try:
+        with io.open(pyc, 'rb') as fp:
+            data = fp.read()
+    except (IOError, OSError):
+        return None
+
+    if data[:4] != MAGIC_NUMBER:
+        return None
+
+    if sys.version_info >= (3, 7):
+        flags = struct.unpack('<I', data[4:8])[0]
+        if flags & 0x1:
+            if source_hash is None:
+                return None
+            if data[8:16] != source_hash(source):
+                return None
+        elif data[8:16] != _source_stamp(st):
+            return None
+        offset = 16
+    elif sys.version_info >= (3, 3):
+        if data[4:12] != _source_stamp(st):
+            return None
+        offset = 12
+    else:
+        if data[4:8] != _source_stamp(st)[:4]:
+            return None
+        offset = 8
+
+    try:
+        code = marshal.loads(data[offset:])
+    except (EOFError, ValueError, TypeError):
+        return None
+
+    if not isinstance(code, types.CodeType):
+        return None
+    return code
+
+
+def _decode(code):
+    '''Yields the opcode and argument of each instruction. This is a lot
+    faster than `dis.get_instructions`, which also isn't available on older
+    interpreters.
+    '''
+    co_code = bytearray(code.co_code)
+    extended = 0
+    i = 0
+    while i < len(co_code):
+        op = co_code[i]
+        if _wordcode:
+            arg = co_code[i + 1] | extended
+            i += 2
+        elif op >= dis.HAVE_ARGUMENT:
+            arg = co_code[i + 1] | co_code[i + 2] << 8 | extended
+            i += 3
+        else:
+            arg = None
+            i += 1
+
+        if op == _EXTENDED_ARG:
+            extended = arg << (8 if _wordcode else 16)
+            continue
+        extended = 0
+        if op != _CACHE:
+            yield op, arg
+
+
+def instructions(code):
+    '''Returns a list of (opcode, argument) tuples for a code object's
+    instructions. The arguments of instructions that load constants or use
+    names are resolved.
+    '''
+    consts = code.co_consts
+    names = code.co_names
+    ops = []
+    for op, arg in _decode(code):
+        if op in _const_ops and op != _LOAD_SMALL_INT:
+            arg = consts[arg]
+        elif op in _name_ops:
+            arg = names[arg >> _name_shift.get(op, 0)]
+        ops.append((op, arg))
+    return ops
+
+
+def _has_imports(code):
+    '''Quickly checks if a code object could have any imports. The import
+    opcode can show up in arguments too, so this can be a false positive.
+    '''
+    if bytearray([_IMPORT_NAME]) in bytearray(code.co_code):
+        return True
+    for name in _import_functions:
+        if name in code.co_names:
+            return True
+    return False
+
+
+class _Unreadable(Exception):
+    pass
+
+
+def _call_args(ops, i):
+    '''Matches a call that starts with loading a function at `i` and is
+    followed by constant arguments. Returns a tuple with the arguments and
+    whether or not the call is an expression statement.
+    '''
+    args = []
+    i += 1
+    while i < len(ops):
+        op, arg = ops[i]
+        i += 1
+        if op in _skip_ops:
+            continue
+        if op in _const_ops:
+            args.append(arg)
+            continue
+        if op in _call_ops and arg == len(args):
+            break
+        raise _Unreadable('Call with non-constant arguments')
+    else:
+        raise _Unreadable('Unexpected end of code')
+
+    while i < len(ops) and ops[i][0] in _skip_ops:
+        i += 1
+    return args, i < len(ops) and ops[i][0] == _POP_TOP
+
+
+def _scan_nested(code, visitor):
+    for name in _import_functions:
+        if name in code.co_varnames or name in code.co_cellvars \
+                or name in code.co_freevars:
+            raise _Unreadable('Local variable named {}'.format(name))
+
+    if _has_imports(code):
+        _scan_code(code, visitor)
+        return
+
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _scan_nested(const, visitor)
+
+
+def _scan_code(code, visitor):
+    '''Adds the imports in a code object and the code objects nested in it
+    to `visitor`, in the order they appear. Raises `_Unreadable` if an
+    import can't be read from the bytecode.
+    '''
+    ops = instructions(code)
+    for i, (op, arg) in enumerate(ops):
+        if op in _const_ops and isinstance(arg, types.CodeType):
+            _scan_nested(arg, visitor)
+
+        elif op == _IMPORT_NAME:
+            if i < 2 or ops[i - 1][0] not in _const_ops:
+                raise _Unreadable('Import without constant arguments')
+            if ops[i - 2][0] not in _const_ops:
+                raise _Unreadable('Import without constant arguments')
+            level = ops[i - 2][1]
+            fromlist = ops[i - 1][1]
+            if fromlist is None:
+                visitor.add_import((arg, ''))
+                continue
+            module = '{}{}'.format('.' * max(level, 0), arg)
+            for fromname in fromlist:
+                visitor.add_import((module, fromname))
+
+        elif op in _store_ops:
+            visitor.scope[arg] = None
+
+        elif op in _delete_ops:
+            visitor.scope.pop(arg, None)
+
+        elif op in _load_ops and arg in _import_functions:
+            args, statement = _call_args(ops, i)
+            if not statement:
+                continue
+            try:
+                visitor.add_import(*programmatic_imports(arg, args, {}))
+            except MoultScannerError as e:
+                log.debug('%s, File: %s', e, visitor.filename)
+
+
+def pyc_scan_file(filename, st=None, digest=None):
+    '''Scans a file's compiled bytecode for imports. Returns the same tuple
+    as `ast_scanner.ast_scan_file`, or None if there's no up to date .pyc
+    file or the imports can't be read from it. The source is added to
+    `digest` if the bytecode is used.
+    '''
+    if not enabled:
+        return None
+
+    pyc = pyc_filename(filename)
+    if pyc is None or not os.path.isfile(pyc):
+        return None
+
+    with stats.timer('pyc'):
+        if st is None:
+            stats.incr('stat.calls')
+            try:
+                st = os.stat(filename)
+            except OSError:
+                return None
+
+        try:
+            with io.open(filename, 'rb') as fp:
+                source = fp.read()
+        except (IOError, OSError):
+            return None
+
+        code = _read_code(pyc, source, st)
+        if code is None:
+            stats.incr('pyc.stale')
+            return None
+
+        if _constant_guard_re.search(source):
+            stats.incr('pyc.constant_guards')
+            return None
+
+        visitor = ImportNodeVisitor(filename)
+        try:
+            _scan_code(code, visitor)
+        except Exception as e:
+            log.debug('Could not read imports from bytecode: %s (%s)', pyc, e)
+            stats.incr('pyc.unreadable')
+            return None
+
+    if digest is not None:
+        digest.update(source)
+    log.debug('Scanned bytecode: %s', pyc)
+    stats.incr('pyc.hits')
+    return visitor.scope, visitor.imports
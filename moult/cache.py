@@ -0,0 +1,220 @@
+'''Persistent caches that are kept between runs.
+'''
+from __future__ import unicode_literals
+
+import os
+import io
+import sys
+import json
+import time
+import hashlib
+import tempfile
+
+from . import __version__, log, stats
+
+
+enabled = True
+cache_dir = None
+
+# Bumped whenever the layout of the cache files or the results of scanning
+# a file change, so caches written before the change aren't used.
+format_version = 2
+
+# Files that are read in chunks while computing content hashes
+_hash_chunk_size = 1024 * 64
+
+_replace = getattr(os, 'replace', os.rename)
+
+
+def default_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') \
+        or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'moult')
+
+
+def cache_path(name):
+    return os.path.join(cache_dir or default_cache_dir(), name)
+
+
+def load_json(name):
+    '''Loads a cache file. Returns None if the cache is disabled, missing, or
+    was written by a different version of moult.
+    '''
+    if not enabled:
+        return None
+
+    filename = cache_path(name)
+    try:
+        with io.open(filename, 'rt', encoding='utf8') as fp:
+            data = json.load(fp)
+    except (IOError, OSError, ValueError):
+        return None
+
+    if not isinstance(data, dict) or data.get('moult') != __version__ \
+            or data.get('format') != format_version:
+        log.debug('Discarding stale cache: %s', filename)
+        return None
+
+    return data.get('data')
+
+
+def write_json(filename, data, **kwargs):
+    '''Writes JSON to a temporary file and renames it over `filename`, so
+    readers never see a partial file. `kwargs` are passed to `json.dumps`.
+    '''
+    dirname = os.path.dirname(os.path.abspath(filename))
+    kwargs.setdefault('separators', (',', ':'))
+
+    try:
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        fd, tmp = tempfile.mkstemp(prefix='.moult', dir=dirname)
+        with io.open(fd, 'wb') as fp:
+            fp.write(json.dumps(data, **kwargs).encode('utf8'))
+        _replace(tmp, filename)
+    except (IOError, OSError) as e:
+        log.warn('Could not write file %s: %s', filename, e)
+        return False
+
+    return True
+
+
+def save_json(name, data):
+    '''Atomically writes a cache file.
+    '''
+    if not enabled:
+        return False
+    return write_json(cache_path(name), {'moult': __version__,
+                                         'format': format_version,
+                                         'data': data})
+
+
+def new_digest():
+    '''Returns the hashlib object used for file digests.
+    '''
+    return hashlib.sha1()
+
+
+def file_digest(filename):
+    '''Returns a hash of a file's contents, or None if it can't be read.
+    '''
+    digest = new_digest()
+    try:
+        with io.open(filename, 'rb') as fp:
+            while True:
+                chunk = fp.read(_hash_chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+    except IOError:
+        return None
+    return digest.hexdigest()
+
+
+class ScanCache(object):
+    '''Import scan results for individual files.
+
+    Entries are keyed on the absolute file name and validated against the
+    file's size and mtime. If only the mtime changed (e.g. after a checkout),
+    the content hash decides whether or not the entry is still good. Each
+    entry stores the names defined in the file's scope and the resolved
+    import paths.
+
+    Relative imports are resolved using the file's package, which depends on
+    the `__init__.py` files in the directories above it. The file's import
+    path is given with the results and stored with the entry, so the entry
+    isn't used if the package changed.
+    '''
+    max_entries = 100000
+
+    # Only refresh an entry's last used time once in a while to avoid
+    # rewriting the cache file on every run.
+    touch_interval = 60 * 60 * 24
+
+    def __init__(self, name=None, max_entries=None):
+        if name is None:
+            name = 'scan-py{}{}.json'.format(*sys.version_info[:2])
+        if max_entries is not None:
+            self.max_entries = max_entries
+        self.name = name
+        self.entries = {}
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def load(self):
+        data = load_json(self.name)
+        if isinstance(data, dict):
+            self.entries = data
+        self.dirty = False
+        return self
+
+    def save(self):
+        if not self.dirty:
+            return False
+        self.evict()
+        if save_json(self.name, self.entries):
+            self.dirty = False
+            return True
+        return False
+
+    def get(self, filename, st, import_path):
+        '''Returns a tuple of scope names and import paths for `filename`, or
+        None if there's no valid entry. `st` is the file's stat result and
+        `import_path` is its current import path.
+        '''
+        entry = self.entries.get(filename)
+        if entry is None:
+            stats.incr('scan_cache.misses')
+            return None
+
+        size, mtime, digest, used, entry_path, scope_keys, imports = entry
+        if size != st.st_size or entry_path != import_path:
+            stats.incr('scan_cache.misses')
+            return None
+
+        now = int(time.time())
+        if mtime != st.st_mtime:
+            if digest != file_digest(filename):
+                stats.incr('scan_cache.misses')
+                return None
+            entry[1] = st.st_mtime
+            entry[3] = now
+            self.dirty = True
+        elif now - used > self.touch_interval:
+            entry[3] = now
+            self.dirty = True
+
+        stats.incr('scan_cache.hits')
+        return scope_keys, imports
+
+    def set(self, filename, st, import_path, scope_keys, imports,
+            digest=None):
+        '''Adds an entry for `filename`. `digest` is the hash of the contents
+        the results came from, which is read from the file if it's not
+        given.
+        '''
+        if digest is None:
+            digest = file_digest(filename)
+            if digest is None:
+                return
+        self.entries[filename] = [st.st_size, st.st_mtime, digest,
+                                  int(time.time()), import_path,
+                                  list(scope_keys), list(imports)]
+        self.dirty = True
+
+    def evict(self):
+        '''Drops the least recently used entries until the cache fits within
+        `max_entries`.
+        '''
+        excess = len(self.entries) - self.max_entries
+        if excess <= 0:
+            return 0
+
+        by_use = sorted(self.entries, key=lambda x: self.entries[x][3])
+        for filename in by_use[:excess]:
+            del self.entries[filename]
+        self.dirty = True
+        return excess
@@ -3,58 +3,172 @@ from __future__ import unicode_literals
 from .compat import PY3
 
 
+class ModuleSet(object):
+    '''An ordered set of PyModules used for dependency edges.
+
+    Modules are compared by identity. Scanned modules are kept in front with
+    the most recently added first, and other modules follow in the order they
+    were added.
+    '''
+    __slots__ = ('_items', '_ids')
+
+    def __init__(self, items=()):
+        self._items = []
+        self._ids = set()
+        for pym in items:
+            self.add(pym)
+
+    def __reduce__(self):
+        return self.__class__, (), (self._items,)
+
+    def __setstate__(self, state):
+        self._items = list(state[0])
+        self._ids = set(id(x) for x in self._items)
+
+    def add(self, pym):
+        if id(pym) in self._ids:
+            return False
+        self._ids.add(id(pym))
+        if pym.is_scan:
+            self._items.insert(0, pym)
+        else:
+            self._items.append(pym)
+        return True
+
+    def discard(self, pym):
+        if id(pym) in self._ids:
+            self._ids.remove(id(pym))
+            for i, item in enumerate(self._items):
+                if item is pym:
+                    del self._items[i]
+                    break
+
+    def __contains__(self, pym):
+        return id(pym) in self._ids
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, i):
+        return self._items[i]
+
+    def __repr__(self):
+        return '<ModuleSet {!r}>'.format(self._items)
+
+
 class PyModule(object):
+    '''An installed package or scanned module.
+
+    Edges and lists that are usually empty share an empty tuple until
+    something is added to them. The files installed outside of the package's
+    location can be loaded on first use with `set_files_loader`.
+    '''
+    __slots__ = ('name', 'import_names', 'version', 'is_scan', 'frameworks',
+                 'location', '_dependencies', 'dependencies', 'dependants',
+                 'user', 'local', 'missing', '_hidden', '_installed_scripts',
+                 '_installed_files', '_files_loader')
+
     def __init__(self, name, version, location='', missing=False):
         self.name = name
         self.import_names = [name]
         self.version = version
         self.is_scan = version in ('SCRIPT', 'MODULE', 'DIRECTORY')
-        self.frameworks = []
+        self.frameworks = ()
         self.location = location
-        self._dependencies = []  # The string list of dependencies
-        self.dependencies = []
-        self.dependants = []
-        self._dependants = []  # This is a shadow dependant list for the turtles
-        self.installed_scripts = []
-        self.installed_files = []
+        self._dependencies = ()  # The string list of dependencies
+        self.dependencies = ()
+        self.dependants = ()
         self.user = False
         self.local = False
-        self.hidden = False
         self.missing = missing
+        self._hidden = None
+        self._installed_scripts = ()
+        self._installed_files = ()
+        self._files_loader = None
 
     def set_import_names(self, names):
         self.import_names = [x.replace('/', '.') for x in names]
 
+    def set_files_loader(self, loader):
+        '''Sets a function that returns a tuple of the installed scripts and
+        files. It's called the first time either of them, or `hidden`, is
+        needed.
+        '''
+        self._files_loader = loader
+        self._installed_scripts = None
+        self._installed_files = None
+
+    def _load_files(self):
+        loader = self._files_loader
+        self._files_loader = None
+        scripts, files = loader() if loader else ((), ())
+        if self._installed_scripts is None:
+            self._installed_scripts = scripts
+        if self._installed_files is None:
+            self._installed_files = files
+
+    @property
+    def files_loaded(self):
+        return self._files_loader is None
+
+    @property
+    def installed_scripts(self):
+        if self._installed_scripts is None:
+            self._load_files()
+        return self._installed_scripts
+
+    @installed_scripts.setter
+    def installed_scripts(self, scripts):
+        self._installed_scripts = scripts
+
+    @property
+    def installed_files(self):
+        if self._installed_files is None:
+            self._load_files()
+        return self._installed_files
+
+    @installed_files.setter
+    def installed_files(self, files):
+        self._installed_files = files
+
+    @property
+    def hidden(self):
+        '''Packages are hidden if they installed scripts, unless this was set
+        explicitly.
+        '''
+        if self._hidden is None:
+            return bool(self.installed_scripts)
+        return self._hidden
+
+    @hidden.setter
+    def hidden(self, hidden):
+        self._hidden = hidden
+
     def add_framework(self, framework):
         if framework not in self.frameworks:
+            self.frameworks = list(self.frameworks)
             self.frameworks.append(framework)
 
     def add_dependency(self, dep):
-        if dep not in self.dependencies:
-            if dep.is_scan:
-                self.dependencies.insert(0, dep)
-            else:
-                self.dependencies.append(dep)
+        if not self.dependencies:
+            self.dependencies = ModuleSet()
+        self.dependencies.add(dep)
 
     def remove_dependency(self, dep):
-        if dep in self.dependencies:
-            self.dependencies.remove(dep)
+        if self.dependencies:
+            self.dependencies.discard(dep)
 
     def add_dependant(self, dep):
-        if dep not in self.dependants:
-            if dep.is_scan:
-                self.dependants.insert(0, dep)
-                self._dependants.insert(0, dep)
-            else:
-                self.dependants.append(dep)
-                self._dependants.append(dep)
+        if not self.dependants:
+            self.dependants = ModuleSet()
+        self.dependants.add(dep)
 
     def remove_dependant(self, dep):
-        if dep in self._dependants:
-            self._dependants.remove(dep)
-
-    def restore_dependants(self):
-        self._dependants = self.dependants[:]
+        if self.dependants:
+            self.dependants.discard(dep)
 
     def __hash__(self):
         return hash((self.name, self.version))
@@ -79,3 +193,107 @@ class PyModule(object):
         if PY3:
             return r
         return r.encode('utf8')
+
+
+class PackageIndex(list):
+    '''A list of PyModules that's indexed by import names and lowercase
+    package names.
+
+    Every name maps to three candidate lists that keep the list's order: user
+    packages, local packages, and all packages. This is the same precedence
+    `utils.find_package` uses when searching a plain list. Appending or
+    inserting at the front updates the index in place. Other changes to the
+    list rebuild it.
+    '''
+    def __init__(self, items=()):
+        super(PackageIndex, self).__init__()
+        self._imports = {}
+        self._packages = {}
+        self.extend(items)
+
+    def __reduce__(self):
+        return self.__class__, (list(self),)
+
+    def _index(self, pym, prepend=False):
+        names = []
+        for name in pym.import_names:
+            if name not in names:
+                names.append(name)
+
+        for index, keys in ((self._imports, names),
+                            (self._packages, (pym.name.lower(),))):
+            for key in keys:
+                ranked = index.get(key)
+                if ranked is None:
+                    ranked = index[key] = ([], [], [])
+                for candidates, match in zip(ranked, (pym.user, pym.local, True)):
+                    if not match:
+                        continue
+                    if prepend:
+                        candidates.insert(0, pym)
+                    else:
+                        candidates.append(pym)
+
+    def _rebuild(self):
+        self._imports.clear()
+        self._packages.clear()
+        for pym in self:
+            self._index(pym)
+
+    def find(self, name, package=False):
+        '''Finds a package by import name, or package name if `package` is
+        true. Scanned modules are never returned.
+        '''
+        if package:
+            ranked = self._packages.get(name.lower())
+        else:
+            ranked = self._imports.get(name)
+
+        if ranked:
+            for candidates in ranked:
+                if candidates and not candidates[0].is_scan:
+                    return candidates[0]
+        return None
+
+    def append(self, pym):
+        super(PackageIndex, self).append(pym)
+        self._index(pym)
+
+    def extend(self, items):
+        for pym in items:
+            self.append(pym)
+
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
+
+    def insert(self, i, pym):
+        super(PackageIndex, self).insert(i, pym)
+        if i == 0 or -i >= len(self):
+            self._index(pym, prepend=True)
+        elif i >= len(self) - 1:
+            self._index(pym)
+        else:
+            self._rebuild()
+
+    def _rebuilds(name):
+        method = getattr(list, name)
+
+        def wrapper(self, *args):
+            result = method(self, *args)
+            self._rebuild()
+            return result
+        wrapper.__name__ = method.__name__
+        return wrapper
+
+    remove = _rebuilds('remove')
+    pop = _rebuilds('pop')
+    sort = _rebuilds('sort')
+    reverse = _rebuilds('reverse')
+    __setitem__ = _rebuilds('__setitem__')
+    __delitem__ = _rebuilds('__delitem__')
+    if not PY3:
+        __setslice__ = _rebuilds('__setslice__')
+        __delslice__ = _rebuilds('__delslice__')
+
+    del _rebuilds
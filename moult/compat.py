@@ -1,7 +1,53 @@
+import os
 import sys
+import stat
 
 PY3 = sys.version_info[0] == 3
 
 str_ = str
 if not PY3:
     str_ = unicode  # noqa
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+class _DirEntry(object):
+    '''Minimal stand-in for os.DirEntry when scandir isn't available.
+    '''
+    __slots__ = ('name', 'path', '_stat')
+
+    def __init__(self, directory, name):
+        self.name = name
+        self.path = os.path.join(directory, name)
+        self._stat = None
+
+    def stat(self):
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+    def is_dir(self):
+        try:
+            return stat.S_ISDIR(self.stat().st_mode)
+        except OSError:
+            return False
+
+    def is_file(self):
+        try:
+            return stat.S_ISREG(self.stat().st_mode)
+        except OSError:
+            return False
+
+
+def listdir_scandir(path):
+    return iter([_DirEntry(path, name) for name in os.listdir(path)])
+
+
+if scandir is None:
+    scandir = listdir_scandir
@@ -0,0 +1,389 @@
+'''A long running process that keeps the installed packages and scans in
+memory, and answers queries over a Unix socket.
+
+Each connection sends one request and receives one response, both as a
+single line of JSON. A request is an object with a `command`, which is one
+of `ping`, `scan`, `freeze`, `removable`, or `stop`, and the absolute
+`paths` to scan. `removable` also takes `show_all` and `recursive`. A
+response has `ok` set to true and the command's `result`, or `ok` set to
+false and an `error` message.
+
+Scanned directories are kept up to date with `watch.Watcher`, so only the
+files that changed since the last query are parsed again. Everything is
+loaded again when the installed packages change.
+'''
+from __future__ import print_function, unicode_literals
+
+import os
+import sys
+import json
+import errno
+import socket
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .exceptions import MoultCommandError
+from .distributions import site_packages_state
+from .graph import DependencyGraph, dependency_order
+from .formats import module_record
+from . import __version__, filesystem_scanner, watch, utils, cache, log
+
+
+commands = ('ping', 'scan', 'freeze', 'removable', 'stop')
+
+# Seconds a client has to send its request before it's dropped
+client_timeout = 10
+
+
+def default_socket():
+    return cache.cache_path('daemon-py{}{}.sock'.format(*sys.version_info[:2]))
+
+
+class FileScan(object):
+    '''A scanned file that's scanned again when its size or modification
+    time changes.
+    '''
+    def __init__(self, filename, installed):
+        self.filename = filename
+        self.installed = installed
+        self.signature = watch._signature(filename)
+        self.pym = filesystem_scanner.scan(filename, installed)
+
+    def update(self):
+        signature = watch._signature(self.filename)
+        if signature != self.signature:
+            drop_scan(self.pym, self.installed)
+            self.signature = signature
+            self.pym = filesystem_scanner.scan(self.filename, self.installed)
+
+
+def drop_scan(pym, installed):
+    '''Removes a scanned module and its edges from the installed packages.
+    '''
+    if pym is None:
+        return
+    for dep in pym.dependencies:
+        dep.remove_dependant(pym)
+    for i, x in enumerate(installed):
+        if x is pym:
+            del installed[i]
+            break
+
+
+class State(object):
+    '''The installed packages and the most recently used scans.
+    '''
+    # Number of scanned files and directories that are kept in memory
+    max_scans = 32
+
+    def __init__(self, local=False, max_scans=None):
+        self.local = local
+        if max_scans is not None:
+            self.max_scans = max_scans
+        self.installed = None
+        self.scans = OrderedDict()
+        self.site_state = None
+
+    def refresh(self):
+        '''Loads the installed packages if they changed. The scans are
+        dropped since they're linked to the old packages.
+
+        The paths are the ones from startup, since loading Django settings
+        adds to sys.path.
+        '''
+        state = site_packages_state(utils.import_paths())
+        if state == self.site_state:
+            return
+        if self.site_state is not None:
+            log.info('Installed packages changed, reloading')
+        self.site_state = state
+        self.scans.clear()
+        utils.clear_import_cache()
+        self.installed = utils.installed_packages(local=self.local)
+
+    def scan(self, path):
+        '''Returns the PyModule for a scanned path, scanning it or updating
+        a previous scan. The least recently used scans are dropped when
+        there are more than `max_scans`.
+        '''
+        path = os.path.abspath(path)
+        entry = self.scans.pop(path, None)
+
+        if entry is not None:
+            try:
+                entry.update()
+            except Exception:
+                drop_scan(entry.pym, self.installed)
+                raise
+        elif os.path.isdir(path):
+            entry = watch.Watcher(path, self.installed)
+        elif os.path.isfile(path):
+            entry = FileScan(path, self.installed)
+        else:
+            raise MoultCommandError('Could not scan: {}'.format(path))
+
+        self.scans[path] = entry
+        while len(self.scans) > self.max_scans:
+            _, old = self.scans.popitem(last=False)
+            drop_scan(old.pym, self.installed)
+
+        if filesystem_scanner.scan_cache is not None:
+            filesystem_scanner.scan_cache.evict()
+
+        return entry.pym
+
+    @contextmanager
+    def only(self, roots):
+        '''Detaches the scans that aren't in `roots` for the duration of a
+        query, so that packages used by other projects aren't counted as
+        used. Yields the packages the query should look at.
+        '''
+        ids = set(id(x) for x in roots)
+        others = [e.pym for e in self.scans.values()
+                  if e.pym is not None and id(e.pym) not in ids]
+        other_ids = set(id(x) for x in others)
+
+        for pym in others:
+            for dep in pym.dependencies:
+                dep.remove_dependant(pym)
+        try:
+            yield [x for x in self.installed if id(x) not in other_ids]
+        finally:
+            for pym in others:
+                for dep in pym.dependencies:
+                    dep.add_dependant(pym)
+
+
+def _scan_roots(state, paths):
+    roots = []
+    for path in paths:
+        pym = state.scan(path)
+        if pym is not None:
+            roots.append(pym)
+    return roots
+
+
+def _scan(state, request):
+    results = []
+    for pym in _scan_roots(state, request.get('paths') or ()):
+        record = module_record(pym)
+        record['frameworks'] = list(pym.frameworks)
+        record['dependencies'] = [module_record(x) for x in pym.dependencies]
+        results.append(record)
+    return results
+
+
+def _freeze(state, request):
+    roots = _scan_roots(state, request.get('paths') or ())
+    requirements = []
+    with state.only(roots):
+        for pym in dependency_order(roots):
+            if not pym.is_scan:
+                requirements.append('{}{}=={}'.format(
+                    '# ' if pym.missing else '', pym.name, pym.version))
+    return requirements
+
+
+def _removable(state, request):
+    roots = _scan_roots(state, request.get('paths') or ())
+    with state.only(roots) as packages:
+        graph = DependencyGraph(packages)
+        waves = graph.removal_groups(packages, request.get('show_all', False),
+                                     request.get('recursive', False))
+    return [[[module_record(x) for x in group] for group in wave]
+            for wave in waves]
+
+
+_handlers = {
+    'ping': lambda state, request: {'version': __version__,
+                                    'pid': os.getpid()},
+    'scan': _scan,
+    'freeze': _freeze,
+    'removable': _removable,
+    'stop': lambda state, request: None,
+}
+
+
+def handle(state, request):
+    '''Answers a request. Errors are returned in the response instead of
+    being raised.
+    '''
+    if not isinstance(request, dict) or request.get('command') not in commands:
+        return {'ok': False, 'error': 'Unknown command'}
+
+    try:
+        state.refresh()
+        result = _handlers[request['command']](state, request)
+    except MoultCommandError as e:
+        return {'ok': False, 'error': str(e)}
+    except Exception as e:
+        log.exception('Error handling request: %s', request)
+        return {'ok': False, 'error': 'Internal error: {}'.format(e)}
+
+    return {'ok': True, 'result': result}
+
+
+def _read_line(sock):
+    chunks = []
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        if b'\n' in chunk:
+            break
+    return b''.join(chunks).split(b'\n', 1)[0].decode('utf8')
+
+
+def _send(sock, data):
+    sock.sendall(json.dumps(data, separators=(',', ':')).encode('utf8') + b'\n')
+
+
+def _listen(socket_path):
+    if not hasattr(socket, 'AF_UNIX'):
+        raise MoultCommandError('Unix sockets are not supported on this'
+                                ' platform')
+
+    if os.path.exists(socket_path):
+        if send_request(socket_path, {'command': 'ping'}, timeout=1) is not None:
+            raise MoultCommandError('A daemon is already running on {}'.format(
+                socket_path))
+        os.unlink(socket_path)
+
+    # The socket is created with the umask's permissions, so it's only ever
+    # accessible to this user
+    umask = os.umask(0o077)
+    try:
+        dirname = os.path.dirname(socket_path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(socket_path)
+    finally:
+        os.umask(umask)
+    server.listen(8)
+    return server
+
+
+def serve(socket_path=None, local=False, max_scans=None):
+    '''Runs the daemon until it's interrupted or receives a `stop` request.
+    Requests are handled one at a time.
+    '''
+    if socket_path is None:
+        socket_path = default_socket()
+
+    state = State(local=local, max_scans=max_scans)
+    state.refresh()
+    if cache.enabled:
+        filesystem_scanner.scan_cache = cache.ScanCache().load()
+
+    server = _listen(socket_path)
+    log.warn('Listening on %s', socket_path)
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            conn.settimeout(client_timeout)
+            try:
+                try:
+                    data = json.loads(_read_line(conn))
+                except ValueError:
+                    data = None
+                log.info('Request: %s', data)
+                response = handle(state, data)
+                _send(conn, response)
+            except socket.timeout:
+                log.warn('Dropped a client that timed out')
+                continue
+            except socket.error as e:
+                log.warn('Connection error: %s', e)
+                continue
+            finally:
+                conn.close()
+
+            if response['ok'] and data['command'] == 'stop':
+                break
+    finally:
+        server.close()
+        try:
+            os.unlink(socket_path)
+        except OSError:
+            pass
+        if filesystem_scanner.scan_cache is not None:
+            filesystem_scanner.scan_cache.save()
+            filesystem_scanner.scan_cache = None
+
+
+def send_request(socket_path, data, timeout=None):
+    '''Sends a request to a daemon. Returns None if no daemon is listening
+    on `socket_path`.
+    '''
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        try:
+            sock.connect(socket_path)
+        except socket.error as e:
+            if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+                return None
+            raise
+        _send(sock, data)
+        line = _read_line(sock)
+    finally:
+        sock.close()
+
+    if not line:
+        return None
+    return json.loads(line)
+
+
+def query(command, paths=(), socket_path=None, show_all=False,
+          recursive=False, use_daemon=True):
+    '''Sends a query to the daemon, or answers it in this process if no
+    daemon is running.
+    '''
+    data = {
+        'command': command,
+        'paths': [os.path.abspath(x) for x in paths],
+        'show_all': show_all,
+        'recursive': recursive,
+    }
+
+    if socket_path is None:
+        socket_path = default_socket()
+
+    if use_daemon:
+        response = send_request(socket_path, data)
+        if response is not None:
+            return response
+        log.info('No daemon running on %s', socket_path)
+
+    if command == 'stop':
+        return {'ok': False, 'error': 'No daemon is running'}
+
+    return handle(State(), data)
+
+
+def main(args):
+    '''Runs the `daemon` or `query` command with parsed arguments.
+    '''
+    if args.no_cache:
+        cache.enabled = False
+
+    if args.command == 'daemon':
+        serve(args.socket, local=args.local, max_scans=args.max_scans)
+        return 0
+
+    paths = args.paths
+    if not paths and args.query in ('scan', 'freeze', 'removable'):
+        paths = ['.']
+
+    response = query(args.query, paths, socket_path=args.socket,
+                     show_all=args.show_all, recursive=args.recursive,
+                     use_daemon=not args.no_daemon)
+    print(json.dumps(response, indent=2, sort_keys=True))
+    return 0 if response.get('ok') else 1
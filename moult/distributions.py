@@ -0,0 +1,521 @@
+'''Reads the metadata of installed distributions without using pip or
+pkg_resources.
+
+Distributions are found by listing the `*.dist-info`, `*.egg-info`, `*.egg`
+and `*.egg-link` entries of each directory in sys.path, in the same order
+pkg_resources would find them. Only the metadata files for the requested
+fields are read.
+'''
+from __future__ import unicode_literals
+
+import io
+import os
+import re
+import sys
+import site
+import hashlib
+import platform
+from multiprocessing.pool import ThreadPool
+
+
+__all__ = ('dist_is_local', 'dist_in_usersite', 'get_installed_distributions',
+           'running_under_virtualenv', 'ignore_packages')
+
+
+# More packages that most likely wouldn't be used by other packages.
+# They're listed here in case they weren't installed normally.
+ignore_packages = (
+    'setuptools',
+    'pip',
+    'python',
+    'distribute',
+    'virtualenv',
+    'virtualenvwrapper',
+    'ipython',
+    'supervisor',
+)
+
+# Distributions pip doesn't list since they're part of the standard library
+_stdlib_pkgs = ('python', 'wsgiref', 'argparse')
+
+# All of the metadata fields that can be read
+all_fields = ('requires', 'top_level', 'files')
+
+# Number of threads used for reading metadata
+read_jobs = 8
+
+_dist_re = re.compile(r'^(?P<name>[^-]+)(-(?P<version>[^-]+))?.*?'
+                      r'\.(?P<ext>dist-info|egg-info|egg|egg-link)$', re.I)
+_legacy_part_re = re.compile(r'(\d+|[a-z]+|\.|-)')
+_requirement_re = re.compile(r'^\s*([A-Za-z0-9][A-Za-z0-9._-]*)')
+_marker_token_re = re.compile(r'''
+    \s*(?:
+        (?P<paren>[()])|
+        (?P<op>===|==|!=|~=|<=|>=|<|>|not\s+in\b|in\b)|
+        (?P<bool>and\b|or\b)|
+        (?P<str>'[^']*'|"[^"]*")|
+        (?P<var>[A-Za-z_][A-Za-z0-9_.]*)
+    )
+''', re.VERBOSE)
+
+
+def running_under_virtualenv():
+    '''Redefinition of pip's running_under_virtualenv().
+    '''
+    return hasattr(sys, 'real_prefix') \
+        or sys.prefix != getattr(sys, 'base_prefix', sys.prefix)
+
+
+def normalize_path(path):
+    return os.path.normcase(os.path.realpath(path))
+
+
+def safe_name(name):
+    '''Same as pkg_resources.safe_name().
+    '''
+    return re.sub(r'[^A-Za-z0-9.]+', '-', name)
+
+
+def _sort_key(name):
+    '''Sort key that approximates the order pkg_resources finds distributions
+    in. Names are compared like setuptools' legacy versions and develop
+    installs come last.
+    '''
+    m = _dist_re.match(name)
+    parts = []
+    for part in _legacy_part_re.split(m.group('name').lower()):
+        if not part or part == '.':
+            continue
+        if part.isdigit():
+            parts.append(part.zfill(8))
+        else:
+            parts.append('*' + part)
+    parts.append('*final')
+    return m.group('ext').lower() != 'egg-link', parts
+
+
+def read_lines(filename):
+    '''Reads the non-empty, non-comment lines of a metadata file.
+    '''
+    try:
+        with io.open(filename, 'rt', encoding='utf8', errors='replace') as fp:
+            lines = [x.strip() for x in fp]
+    except (IOError, OSError):
+        return []
+    return [x for x in lines if x and not x.startswith('#')]
+
+
+def read_headers(filename):
+    '''Reads the RFC 822 style headers of a METADATA or PKG-INFO file. The
+    description body is never read.
+    '''
+    headers = []
+    try:
+        with io.open(filename, 'rt', encoding='utf8', errors='replace') as fp:
+            for line in fp:
+                line = line.rstrip('\r\n')
+                if not line:
+                    break
+                if line[0] in ' \t' and headers:
+                    headers[-1][1] += ' ' + line.strip()
+                elif ':' in line:
+                    key, value = line.split(':', 1)
+                    headers.append([key.strip().lower(), value.strip()])
+    except (IOError, OSError):
+        pass
+    return headers
+
+
+def marker_environment():
+    implementation = getattr(sys, 'implementation', None)
+    if implementation is not None:
+        implementation_name = implementation.name
+        iv = implementation.version
+        implementation_version = '{}.{}.{}'.format(iv.major, iv.minor, iv.micro)
+    else:
+        implementation_name = platform.python_implementation().lower()
+        implementation_version = platform.python_version()
+
+    return {
+        'os_name': os.name,
+        'sys_platform': sys.platform,
+        'platform_machine': platform.machine(),
+        'platform_python_implementation': platform.python_implementation(),
+        'platform_release': platform.release(),
+        'platform_system': platform.system(),
+        'platform_version': platform.version(),
+        'python_version': '{}.{}'.format(*sys.version_info[:2]),
+        'python_full_version': platform.python_version(),
+        'implementation_name': implementation_name,
+        'implementation_version': implementation_version,
+        'extra': '',
+    }
+
+
+_environment = None
+
+
+def _version_key(value):
+    parts = []
+    for part in value.split('.'):
+        if not part.isdigit():
+            return None
+        parts.append(int(part))
+    while parts and not parts[-1]:
+        parts.pop()
+    return tuple(parts)
+
+
+def _compare(left, op, right):
+    if op in ('in', 'not in'):
+        return (left in right) == (op == 'in')
+
+    if op == '===':
+        return left == right
+
+    lkey = _version_key(left)
+    rkey = _version_key(right)
+    if lkey is not None and rkey is not None:
+        left, right = lkey, rkey
+        if op == '~=':
+            prefix = rkey[:max(1, len(rkey) - 1)]
+            return lkey >= rkey and lkey[:len(prefix)] == prefix
+
+    if op == '==':
+        return left == right
+    elif op == '!=':
+        return left != right
+    elif op == '<':
+        return left < right
+    elif op == '<=':
+        return left <= right
+    elif op == '>':
+        return left > right
+    elif op == '>=':
+        return left >= right
+    raise ValueError('Unsupported marker operator: {}'.format(op))
+
+
+def evaluate_marker(marker, environment=None):
+    '''Evaluates a PEP 508 environment marker. Markers that can't be parsed
+    are considered true so that requirements aren't silently dropped.
+    '''
+    global _environment
+    if environment is None:
+        if _environment is None:
+            _environment = marker_environment()
+        environment = _environment
+
+    tokens = []
+    pos = 0
+    marker = marker.strip()
+    while pos < len(marker):
+        m = _marker_token_re.match(marker, pos)
+        if not m or m.end() == pos:
+            return True
+        pos = m.end()
+        kind = m.lastgroup
+        value = m.group(kind)
+        if kind == 'op':
+            value = ' '.join(value.split())
+        tokens.append((kind, value))
+
+    def value_of(token):
+        kind, value = token
+        if kind == 'str':
+            return value[1:-1]
+        if kind == 'var':
+            return environment.get(value.replace('.', '_'), '')
+        raise ValueError('Expected a value')
+
+    def parse_or(i):
+        result, i = parse_and(i)
+        while i < len(tokens) and tokens[i] == ('bool', 'or'):
+            right, i = parse_and(i + 1)
+            result = result or right
+        return result, i
+
+    def parse_and(i):
+        result, i = parse_atom(i)
+        while i < len(tokens) and tokens[i] == ('bool', 'and'):
+            right, i = parse_atom(i + 1)
+            result = result and right
+        return result, i
+
+    def parse_atom(i):
+        if tokens[i] == ('paren', '('):
+            result, i = parse_or(i + 1)
+            if tokens[i] != ('paren', ')'):
+                raise ValueError('Unbalanced parentheses')
+            return result, i + 1
+        left = value_of(tokens[i])
+        kind, op = tokens[i + 1]
+        if kind != 'op':
+            raise ValueError('Expected an operator')
+        right = value_of(tokens[i + 2])
+        return _compare(left, op, right), i + 3
+
+    try:
+        result, i = parse_or(0)
+        if i != len(tokens):
+            return True
+        return result
+    except (IndexError, ValueError):
+        return True
+
+
+def requirement_name(requirement):
+    '''Returns the project name of a requirement string, or None if the
+    requirement's marker doesn't apply to this environment.
+    '''
+    requirement, _, marker = requirement.partition(';')
+    if marker and not evaluate_marker(marker):
+        return None
+    m = _requirement_re.match(requirement)
+    if not m:
+        return None
+    return safe_name(m.group(1))
+
+
+class Distribution(object):
+    '''An installed distribution's metadata.
+
+    `requires`, `top_level`, and `files` are None until they're read with
+    `load()`.
+    '''
+    def __init__(self, project_name, version, location, metadata_path, kind):
+        self.project_name = project_name
+        self.key = project_name.lower()
+        self.version = version
+        self.location = location
+        self.metadata_path = metadata_path
+        self.kind = kind
+        self.egg_link = None
+        self.requires = None
+        self.top_level = None
+        self.files = None
+
+    def __repr__(self):
+        return str('<Distribution {} {}>'.format(self.project_name,
+                                                   self.version))
+
+    def metadata_file(self, name):
+        if os.path.isdir(self.metadata_path):
+            return os.path.join(self.metadata_path, name)
+        # .egg-info files only contain PKG-INFO
+        return None
+
+    def load(self, fields=all_fields):
+        if not self.version:
+            filename = self.metadata_file('METADATA' if self.kind == 'dist-info'
+                                          else 'PKG-INFO') or self.metadata_path
+            for key, value in read_headers(filename):
+                if key == 'version':
+                    self.version = value
+                    break
+
+        if 'requires' in fields and self.requires is None:
+            self.requires = self._read_requires()
+
+        if 'top_level' in fields and self.top_level is None:
+            filename = self.metadata_file('top_level.txt')
+            if filename and os.path.isfile(filename):
+                self.top_level = read_lines(filename)
+
+        if 'files' in fields and self.files is None:
+            self.files = list(self._iter_files())
+
+        return self
+
+    def _read_requires(self):
+        requires = []
+
+        if self.kind == 'dist-info':
+            filename = self.metadata_file('METADATA')
+            for key, value in read_headers(filename):
+                if key == 'requires-dist':
+                    name = requirement_name(value)
+                    if name and name not in requires:
+                        requires.append(name)
+            return requires
+
+        filename = self.metadata_file('requires.txt')
+        if not filename:
+            return requires
+
+        section_applies = True
+        for line in read_lines(filename):
+            if line.startswith('['):
+                extra, _, marker = line.strip('[]').partition(':')
+                # Sections for extras aren't installed by default
+                section_applies = not extra.strip() \
+                    and evaluate_marker(marker)
+                continue
+            if section_applies:
+                name = requirement_name(line)
+                if name and name not in requires:
+                    requires.append(name)
+        return requires
+
+    def _iter_files(self):
+        if self.kind == 'dist-info':
+            filename = self.metadata_file('RECORD')
+            for line in read_lines(filename):
+                line = line.split(',')[0]
+                if line.endswith('.pyc'):
+                    continue
+                yield os.path.normpath(os.path.join(self.location, line))
+            return
+
+        filename = self.metadata_file('installed-files.txt')
+        if not filename:
+            return
+        for line in read_lines(filename):
+            if line.endswith('.pyc'):
+                continue
+            yield os.path.normpath(os.path.join(self.metadata_path, line))
+
+
+def _path_distributions(path):
+    '''Finds the distributions in a single sys.path entry.
+    '''
+    if path.lower().endswith('.egg') and os.path.isdir(path):
+        m = _dist_re.match(os.path.basename(path))
+        if m:
+            return [Distribution(safe_name(m.group('name')), m.group('version'),
+                                 path, os.path.join(path, 'EGG-INFO'), 'egg')]
+
+    try:
+        names = os.listdir(path)
+    except (IOError, OSError):
+        return []
+
+    dists = []
+    names = [x for x in names if _dist_re.match(x)]
+    for name in sorted(names, key=_sort_key, reverse=True):
+        m = _dist_re.match(name)
+
+        ext = m.group('ext').lower()
+        project_name = safe_name(m.group('name'))
+        version = m.group('version')
+        fullpath = os.path.join(path, name)
+
+        if ext == 'egg-link':
+            for link in read_lines(fullpath)[:1]:
+                link = os.path.normpath(os.path.join(path, link))
+                for dist in _path_distributions(link):
+                    if dist.key == project_name.lower():
+                        dist.egg_link = fullpath
+                        dists.append(dist)
+        elif ext == 'egg':
+            if os.path.isdir(fullpath):
+                dists.append(Distribution(project_name, version, fullpath,
+                                          os.path.join(fullpath, 'EGG-INFO'),
+                                          'egg'))
+        else:
+            dists.append(Distribution(project_name, version, path, fullpath,
+                                      ext))
+
+    return dists
+
+
+def find_distributions(paths=None):
+    '''Finds distributions on the supplied paths, or sys.path. The first
+    distribution found for a project wins.
+    '''
+    if paths is None:
+        paths = sys.path
+
+    found = {}
+    egg_links = {}
+    dists = []
+
+    for path in paths:
+        path = os.path.abspath(path or os.curdir)
+        for dist in _path_distributions(path):
+            if dist.egg_link:
+                egg_links.setdefault(dist.key, dist.egg_link)
+            if dist.key in found:
+                continue
+            found[dist.key] = dist
+            dists.append(dist)
+
+    for dist in dists:
+        if not dist.egg_link:
+            dist.egg_link = egg_links.get(dist.key)
+
+    return dists
+
+
+def site_packages_state(paths=None):
+    '''Returns a hash of the directories distributions are found in, their
+    mtimes, and the distribution metadata entries they contain. The hash
+    changes when packages are installed or removed.
+    '''
+    if paths is None:
+        paths = sys.path
+
+    digest = hashlib.sha1()
+    digest.update(repr((sys.prefix, sys.executable, sys.version)).encode('utf8'))
+
+    for path in paths:
+        path = os.path.abspath(path or os.curdir)
+        try:
+            mtime = os.stat(path).st_mtime
+            names = sorted(x for x in os.listdir(path) if _dist_re.match(x))
+        except (IOError, OSError):
+            mtime = None
+            names = []
+        digest.update(repr((path, mtime, names)).encode('utf8'))
+
+    return digest.hexdigest()
+
+
+def dist_location(dist):
+    '''The site-packages location of the distribution. For develop installs,
+    this is the location of the .egg-link file.
+    '''
+    return dist.egg_link or dist.location
+
+
+def dist_is_local(dist):
+    if not running_under_virtualenv():
+        return True
+    return normalize_path(dist_location(dist)).startswith(normalize_path(sys.prefix))
+
+
+def dist_in_usersite(dist):
+    user_site = getattr(site, 'USER_SITE', None)
+    if not user_site:
+        return False
+    return normalize_path(dist_location(dist)).startswith(normalize_path(user_site))
+
+
+def _load(args):
+    dist, fields = args
+    return dist.load(fields)
+
+
+def get_installed_distributions(local_only=True, fields=all_fields,
+                                paths=None):
+    '''Returns the installed distributions with the requested metadata
+    `fields` loaded. Metadata is read in a thread pool.
+    '''
+    dists = []
+    for dist in find_distributions(paths):
+        if dist.key in _stdlib_pkgs or (local_only and not dist_is_local(dist)):
+            continue
+        dists.append(dist)
+
+    if len(dists) > read_jobs * 4:
+        pool = ThreadPool(read_jobs)
+        try:
+            pool.map(_load, [(x, fields) for x in dists])
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for dist in dists:
+            dist.load(fields)
+
+    return dists
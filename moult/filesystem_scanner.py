@@ -1,13 +1,20 @@
 import os
 import re
+import stat
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 
 from .classes import PyModule
 from .ast_scanner import ast_scan_file
+from .bytecode_scanner import pyc_scan_file
+from .stream_scanner import stream_scan_file
 from .frameworks import django
-from . import utils, log
+from .compat import scandir
+from . import cache, utils, log, stats
 
 
 max_directory_depth = 20
+# Files bigger than this are streamed instead of parsed
 max_file_size = 1024 * 1204
 
 # Common ignorable directories
@@ -16,80 +23,294 @@ _dir_ignore = re.compile(r'(\.(git|hg|svn|tox)|CVS|__pycache__)\b')
 # Files to not even bother with scanning
 _ext_ignore = re.compile(r'\.(pyc|html|js|css|zip|tar(\.gz)?|txt|swp|~|bak|db)$', re.I)
 
+# A `cache.ScanCache` instance that's consulted before parsing files
+scan_cache = None
 
-def _scan_file(filename, sentinel, source_type='import'):
+# Directories are no longer scanned after this many files in a row that
+# aren't python scripts, since they look like data dumps
+_max_bad_scans = 100
+
+
+def _parse_file(filename, size=None):
+    '''Parses a file for its scope names and import paths. This is the unit of
+    work for the process pool. An up to date .pyc file is used instead of
+    the source if there is one. Files bigger than `max_file_size` are read
+    with `stream_scan_file` if their `size` is given.
+
+    A hash of the source is also returned for `scan_cache`, so the cache
+    doesn't have to read it again.
+    '''
+    digest = cache.new_digest()
+    result = pyc_scan_file(filename, digest=digest)
+    if result is None:
+        if size is not None and size > max_file_size:
+            log.info('Streaming large file: %s', filename)
+            result = stream_scan_file(filename, digest)
+        else:
+            result = ast_scan_file(filename, digest=digest)
+    scope, imports = result
+    if scope is None or imports is None:
+        return filename, None, None, None
+    return (filename, list(scope), [imp.import_path for imp in imports],
+            digest.hexdigest())
+
+
+def _init_worker(profiling):
+    stats.enabled = profiling
+
+
+def _pool_parse_file(filename):
+    '''Same as `_parse_file`, but also returns the stats recorded in a worker
+    process so they can be merged into the parent's.
+    '''
+    stats.reset()
+    return _parse_file(filename) + (stats.snapshot(),)
+
+
+def _file_imports(filename, st, prescanned=None):
+    '''Returns a tuple containing the names defined in a file's scope and the
+    import paths it uses. Files that were already parsed by `prescan` or are
+    in the scan cache are not parsed again.
+    '''
+    if prescanned and filename in prescanned:
+        return prescanned.pop(filename)
+
+    if scan_cache is not None:
+        import_path = utils.import_path_from_file(filename)[0]
+        cached = scan_cache.get(filename, st, import_path)
+        if cached is not None:
+            return cached
+
+    _, scope_keys, import_paths, digest = _parse_file(filename, st.st_size)
+    if scope_keys is not None and scan_cache is not None:
+        scan_cache.set(filename, st, import_path, scope_keys, import_paths,
+                       digest)
+
+    return scope_keys, import_paths
+
+
+def _sentinel_key(path, st):
+    '''Key for tracking files and directories that were already scanned. The
+    device and inode identify the real file without resolving symlinks.
+    '''
+    if st.st_ino:
+        return (st.st_dev, st.st_ino)
+    # Windows on Python 2 doesn't report inodes
+    return os.path.realpath(path)
+
+
+def _scan_file(filename, sentinel, source_type='import', prescanned=None,
+               st=None):
     '''Generator that performs the actual scanning of files.
 
     Yeilds a tuple containing import type, import path, and an extra file
     that should be scanned. Extra file scans should be the file or directory
-    that relates to the import name.
+    that relates to the import name. `st` can be the file's stat result if
+    it's already known.
     '''
     filename = os.path.abspath(filename)
-    real_filename = os.path.realpath(filename)
 
-    if os.path.getsize(filename) <= max_file_size:
-        if real_filename not in sentinel and os.path.isfile(filename):
-            sentinel.add(real_filename)
+    if st is None:
+        stats.incr('stat.calls')
+        st = os.stat(filename)
 
-            basename = os.path.basename(filename)
-            scope, imports = ast_scan_file(filename)
+    key = _sentinel_key(filename, st)
+    if key not in sentinel and stat.S_ISREG(st.st_mode):
+        sentinel.add(key)
 
-            if scope is not None and imports is not None:
-                for imp in imports:
-                    yield (source_type, imp.module, None)
+        basename = os.path.basename(filename)
+        scope, imports = _file_imports(filename, st, prescanned)
 
-                if 'INSTALLED_APPS' in scope and basename == 'settings.py':
-                    log.info('Found Django settings: %s', filename)
-                    for item in django.handle_django_settings(filename):
-                        yield item
-            else:
-                log.warn('Could not scan imports from: %s', filename)
-    else:
-        log.warn('File size too large: %s', filename)
+        if scope is not None and imports is not None:
+            for imp in imports:
+                yield (source_type, imp.split('.', 1)[0], None)
+
+            if 'INSTALLED_APPS' in scope and basename == 'settings.py':
+                log.info('Found Django settings: %s', filename)
+                with stats.timer('django'):
+                    items = list(django.handle_django_settings(filename))
+                for item in items:
+                    yield item
+        else:
+            log.warn('Could not scan imports from: %s', filename)
 
 
 def _scan_directory(directory, sentinel, depth=0):
-    '''Basically os.listdir with some filtering.
+    '''Basically os.scandir with some filtering.
+
+    Yields the directory entries of files and directories that should be
+    scanned. The entries' cached type information is used to avoid extra
+    filesystem calls.
     '''
+    if depth >= max_directory_depth:
+        return
+
     directory = os.path.abspath(directory)
-    real_directory = os.path.realpath(directory)
+    with stats.timer('walk'):
+        entries = _list_directory(directory, sentinel)
+
+    for entry in entries:
+        yield entry
+
+
+def _list_directory(directory, sentinel):
+    stats.incr('stat.calls')
+    try:
+        st = os.stat(directory)
+    except OSError:
+        return []
+
+    key = _sentinel_key(directory, st)
+    if key in sentinel or not stat.S_ISDIR(st.st_mode):
+        return []
+    sentinel.add(key)
+
+    try:
+        entries = scandir(directory)
+    except OSError:
+        log.warn('Could not read directory: %s', directory)
+        return []
+
+    scannable = []
+    for entry in entries:
+        if entry.is_dir():
+            if _dir_ignore.search(entry.path):
+                continue
+        elif entry.is_file():
+            if _ext_ignore.search(entry.path):
+                continue
+        else:
+            continue
 
-    if depth < max_directory_depth and real_directory not in sentinel \
-            and os.path.isdir(directory):
-        sentinel.add(real_directory)
+        scannable.append(entry)
 
-        for item in os.listdir(directory):
-            if item in ('.', '..'):
-                # I'm not sure if this is even needed any more.
-                continue
+    return scannable
+
+
+def _collect_files(directory, sentinel, depth=0):
+    '''Walks a directory like `scan_directory` and yields the files that it
+    would scan, stopping at data dumps in the same way.
+    '''
+    bad_scans = 0
+
+    for entry in _scan_directory(directory, sentinel, depth):
+        if entry.is_dir():
+            for filename in _collect_files(entry.path, sentinel, depth + 1):
+                yield filename
+        elif bad_scans > _max_bad_scans:
+            break
+        elif utils.is_python_script(entry.path):
+            bad_scans = 0
+            yield entry.path
+        else:
+            bad_scans += 1
+
+
+def prescan(filenames, jobs, threads=False):
+    '''Parses files using a pool of `jobs` processes, or threads if `threads`
+    is true.
 
-            p = os.path.abspath(os.path.join(directory, item))
-            if (os.path.isdir(p) and _dir_ignore.search(p)) \
-                    or (os.path.isfile(p) and _ext_ignore.search(p)):
+    Returns a dict that maps the file names to their scope names and import
+    paths. The dict is meant to be passed to the scan functions which will
+    use and remove the results in the same order as a serial scan would.
+    '''
+    prescanned = {}
+    pending = []
+
+    for filename in filenames:
+        stats.incr('stat.calls')
+        try:
+            st = os.stat(filename)
+        except OSError:
+            continue
+
+        # Big files are streamed one at a time by `_scan_file`
+        if st.st_size > max_file_size:
+            continue
+
+        import_path = None
+        if scan_cache is not None:
+            import_path = utils.import_path_from_file(filename)[0]
+            cached = scan_cache.get(filename, st, import_path)
+            if cached is not None:
+                prescanned[filename] = cached
                 continue
 
-            yield p
+        pending.append((filename, (st, import_path)))
 
+    if not pending:
+        return prescanned
 
-def scan_file(pym, filename, sentinel, installed):
+    log.debug('Parsing %d files using %d %s', len(pending), jobs,
+              'threads' if threads else 'processes')
+    cache_keys = dict(pending)
+    chunksize = max(1, min(100, len(pending) // (jobs * 4)))
+    if threads:
+        pool = ThreadPool(jobs)
+        parse_file = _parse_file
+    else:
+        pool = multiprocessing.Pool(jobs, _init_worker, (stats.enabled,))
+        parse_file = _pool_parse_file
+
+    try:
+        for result in pool.imap_unordered(parse_file, [x[0] for x in pending],
+                                          chunksize):
+            filename, scope_keys, import_paths, digest = result[:4]
+            if len(result) > 4:
+                stats.merge(result[4])
+            prescanned[filename] = (scope_keys, import_paths)
+            if scope_keys is not None and scan_cache is not None:
+                st, import_path = cache_keys[filename]
+                scan_cache.set(filename, st, import_path, scope_keys,
+                               import_paths, digest)
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    return prescanned
+
+
+def scan_module(filename, installed):
+    '''Returns the PyModule for a scanned file or directory, creating it if
+    needed.
+    '''
+    filename = os.path.abspath(filename)
+    basename = os.path.basename(filename)
+
+    # This is for finding a previously created instance, not finding an
+    # installed module with the same name. Might need to base the name
+    # on the actual paths to reduce ambiguity in the printed scan results.
+    pym = utils.find_package(basename, installed)
+    if pym:
+        pym.is_scan = True
+        return pym
+
+    if os.path.isdir(filename):
+        version = 'DIRECTORY'
+        if os.path.isfile(os.path.join(filename, '__init__.py')):
+            version = 'MODULE'
+    else:
+        version = 'SCRIPT'
+
+    pym = PyModule(basename, version, filename)
+    installed.insert(0, pym)
+    return pym
+
+
+def scan_file(pym, filename, sentinel, installed, prescanned=None, st=None):
     '''Entry point scan that creates a PyModule instance if needed.
     '''
     if not utils.is_python_script(filename):
         return
 
     if not pym:
-        # This is for finding a previously created instance, not finding an
-        # installed module with the same name. Might need to base the name
-        # on the actual paths to reduce ambiguity in the printed scan results.
-        module = os.path.basename(filename)
-        pym = utils.find_package(module, installed)
-        if not pym:
-            pym = PyModule(module, 'SCRIPT', os.path.abspath(filename))
-            installed.insert(0, pym)
-        else:
-            pym.is_scan = True
+        pym = scan_module(filename, installed)
 
-    for imp_type, import_path, extra_file_scan in _scan_file(filename, sentinel):
+    for imp_type, import_path, extra_file_scan in \
+            _scan_file(filename, sentinel, prescanned=prescanned, st=st):
         dep = utils.find_package(import_path, installed)
         if dep:
             dep.add_dependant(pym)
@@ -104,58 +325,62 @@ def scan_file(pym, filename, sentinel, installed):
             scan_filename = utils.file_containing_import(import_path, extra_file_scan)
             log.info('Related scan: %s - %s', import_path, scan_filename)
             if scan_filename.endswith('__init__.py'):
-                scan_directory(pym, os.path.dirname(scan_filename), sentinel, installed)
+                scan_directory(pym, os.path.dirname(scan_filename), sentinel,
+                               installed, prescanned=prescanned)
             else:
-                scan_file(pym, scan_filename, sentinel, installed)
+                scan_file(pym, scan_filename, sentinel, installed,
+                          prescanned=prescanned)
 
     return pym
 
 
-def scan_directory(pym, directory, sentinel, installed, depth=0):
+def scan_directory(pym, directory, sentinel, installed, depth=0,
+                   prescanned=None):
     '''Entry point scan that creates a PyModule instance if needed.
     '''
     if not pym:
-        d = os.path.abspath(directory)
-        basename = os.path.basename(d)
-        pym = utils.find_package(basename, installed)
-        if not pym:
-            version = 'DIRECTORY'
-            if os.path.isfile(os.path.join(d, '__init__.py')):
-                version = 'MODULE'
-            pym = PyModule(basename, version, d)
-            installed.insert(0, pym)
-        else:
-            pym.is_scan = True
+        pym = scan_module(directory, installed)
 
     # Keep track of how many file scans resulted in nothing
     bad_scans = 0
 
-    for item in _scan_directory(directory, sentinel, depth):
-        if os.path.isfile(item):
-            if bad_scans > 100:
+    for entry in _scan_directory(directory, sentinel, depth):
+        if entry.is_dir():
+            scan_directory(pym, entry.path, sentinel, installed, depth + 1,
+                           prescanned)
+        else:
+            if bad_scans > _max_bad_scans:
                 # Keep in mind this counter resets if it a good scan happens
                 # in *this* directory. If you have a module with more than 100
                 # files in a single directory, you should probably refactor it.
                 log.debug('Stopping scan of directory since it looks like a data dump: %s', directory)
                 break
 
-            if not scan_file(pym, item, sentinel, installed):
+            stats.incr('stat.calls')
+            if not scan_file(pym, entry.path, sentinel, installed,
+                             prescanned, entry.stat()):
                 bad_scans += 1
             else:
                 bad_scans = 0
-        elif os.path.isdir(item):
-            scan_directory(pym, item, sentinel, installed, depth + 1)
 
     return pym
 
 
-def scan(filename, installed, sentinel=None):
+def scan(filename, installed, sentinel=None, jobs=1, threads=False):
+    '''Scans a file or directory. If `jobs` is greater than 1, the files in a
+    directory are parsed in parallel before they're added to the scan.
+    '''
     if not sentinel:
         sentinel = set()
 
     if os.path.isfile(filename):
         return scan_file(None, filename, sentinel, installed)
     elif os.path.isdir(filename):
-        return scan_directory(None, filename, sentinel, installed)
+        prescanned = None
+        if jobs > 1:
+            files = _collect_files(filename, set(sentinel))
+            prescanned = prescan(files, jobs, threads)
+        return scan_directory(None, filename, sentinel, installed,
+                              prescanned=prescanned)
     else:
         log.error('Could not scan: %s', filename)
@@ -0,0 +1,126 @@
+'''Machine readable output.
+
+Results are written as records as soon as they're found, without any of the
+color or wrapping work done for the text output. Each record is a JSON
+object with a `type`:
+
+- `module`: A scanned or installed module. Each module is only written once.
+- `edge`: `from` depends on `to`. Both modules are written before the edge.
+- `removable`: A module that can be removed. `wave` and `group` are the
+  indexes of its wave and group of removable packages.
+- `requirement`: A requirement for `--freeze`, in install order.
+- `new_import` and `unused`: Changes found by `--watch` in `scan`.
+
+`ndjson` writes one record per line. `json` writes the same records as a
+JSON array.
+'''
+from __future__ import unicode_literals
+
+import sys
+import json
+
+
+def module_record(pym):
+    record = {
+        'name': pym.name,
+        'version': pym.version,
+        'location': pym.location,
+        'scan': pym.is_scan,
+        'hidden': bool(pym.hidden),
+        'missing': bool(pym.missing),
+        'local': bool(pym.local),
+        'user': bool(pym.user),
+    }
+    if pym.frameworks:
+        record['frameworks'] = list(pym.frameworks)
+    return record
+
+
+class RecordWriter(object):
+    '''Writes records as newline delimited JSON.
+    '''
+    def __init__(self, fp=None):
+        self.fp = fp or sys.stdout
+        self.modules = set()
+        self.edges = set()
+
+    def _encode(self, record):
+        return json.dumps(record, separators=(',', ':'))
+
+    def write(self, record):
+        self.fp.write(self._encode(record) + '\n')
+
+    def flush(self):
+        self.fp.flush()
+
+    def close(self):
+        self.flush()
+
+    def module(self, pym):
+        '''Writes a module record if the module wasn't already written.
+        '''
+        if id(pym) in self.modules:
+            return
+        self.modules.add(id(pym))
+        record = module_record(pym)
+        record['type'] = 'module'
+        self.write(record)
+
+    def edge(self, pym, dep):
+        '''Writes an edge from a module to one of its dependencies, after
+        the records of both modules.
+        '''
+        key = (id(pym), id(dep))
+        if key in self.edges:
+            return
+        self.edges.add(key)
+        self.module(pym)
+        self.module(dep)
+        self.write({'type': 'edge', 'from': pym.name, 'to': dep.name})
+
+    def module_edges(self, pym):
+        '''Writes a module with the edges to its dependencies and from its
+        dependants.
+        '''
+        self.module(pym)
+        for dep in pym.dependencies:
+            self.edge(pym, dep)
+        for dep in pym.dependants:
+            self.edge(dep, pym)
+
+    def removable(self, pym, wave, group):
+        self.module(pym)
+        self.write({'type': 'removable', 'name': pym.name, 'wave': wave,
+                    'group': group})
+
+    def requirement(self, pym):
+        self.write({'type': 'requirement', 'name': pym.name,
+                    'version': pym.version, 'missing': bool(pym.missing)})
+
+
+class JSONArrayWriter(RecordWriter):
+    '''Writes records as the items of a JSON array. The array is closed by
+    `close`.
+    '''
+    def __init__(self, fp=None):
+        super(JSONArrayWriter, self).__init__(fp)
+        self.count = 0
+
+    def write(self, record):
+        separator = ',\n' if self.count else '[\n'
+        self.fp.write(separator + self._encode(record))
+        self.count += 1
+
+    def close(self):
+        self.fp.write('\n]\n' if self.count else '[]\n')
+        self.flush()
+
+
+def writer(name, fp=None):
+    '''Returns a record writer for an output format, or None for text.
+    '''
+    if name == 'ndjson':
+        return RecordWriter(fp)
+    if name == 'json':
+        return JSONArrayWriter(fp)
+    return None
@@ -0,0 +1,367 @@
+'''Analysis of the dependency graph between PyModules.
+
+The graph is a snapshot of the `dependencies` and `dependants` of the
+modules it's created from. Nodes are referred to by their integer index so
+that the analysis doesn't need to change the PyModules themselves.
+'''
+from __future__ import unicode_literals
+
+
+class DependencyGraph(object):
+    '''Integer indexed adjacency lists for a list of PyModules.
+
+    Modules that are only reachable through the edges of the supplied
+    modules are added to the end of `nodes`. `dependencies[i]` lists the
+    indexes that `nodes[i]` depends on, in the same order as the module's
+    `dependencies`. `dependants[i]` is the reverse.
+    '''
+    def __init__(self, packages):
+        self.nodes = []
+        self.index = {}
+        self.dependencies = []
+        self.dependants = []
+        self._components = None
+        self._reachability = None
+
+        for pym in packages:
+            self._add(pym)
+
+        i = 0
+        while i < len(self.nodes):
+            pym = self.nodes[i]
+            self.dependencies[i] = [self._add(dep) for dep in pym.dependencies]
+            for dep in pym.dependants:
+                self._add(dep)
+            i += 1
+
+        for i, deps in enumerate(self.dependencies):
+            for j in deps:
+                self.dependants[j].append(i)
+
+    def _add(self, pym):
+        i = self.index.get(id(pym))
+        if i is None:
+            i = self.index[id(pym)] = len(self.nodes)
+            self.nodes.append(pym)
+            self.dependencies.append(None)
+            self.dependants.append([])
+        return i
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def indexes(self, packages):
+        return [self.index[id(pym)] for pym in packages]
+
+    def is_removable(self, i, show_all=False):
+        '''Whether or not a node could be suggested for removal, regardless
+        of its dependants. Scanned and missing modules can't be removed.
+        Hidden modules can only be removed if `show_all` is true.
+        '''
+        pym = self.nodes[i]
+        return not pym.missing and not pym.is_scan \
+            and (show_all or not pym.hidden)
+
+    def components(self):
+        '''Finds the strongly connected components of the dependency graph
+        using an iterative version of Tarjan's algorithm.
+
+        Returns a tuple with the list of components and a list that maps
+        each node to its component. Each component is a sorted list of node
+        indexes. Components come before the components that depend on them.
+        '''
+        if self._components is not None:
+            return self._components
+
+        n = len(self.nodes)
+        order = [-1] * n
+        low = [0] * n
+        on_stack = [False] * n
+        stack = []
+        components = []
+        component_of = [-1] * n
+        counter = 0
+
+        for root in range(n):
+            if order[root] != -1:
+                continue
+
+            order[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            work = [[root, 0]]
+
+            while work:
+                frame = work[-1]
+                v = frame[0]
+                deps = self.dependencies[v]
+
+                if frame[1] < len(deps):
+                    w = deps[frame[1]]
+                    frame[1] += 1
+                    if order[w] == -1:
+                        order[w] = low[w] = counter
+                        counter += 1
+                        stack.append(w)
+                        on_stack[w] = True
+                        work.append([w, 0])
+                    elif on_stack[w] and order[w] < low[v]:
+                        low[v] = order[w]
+                    continue
+
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    if low[v] < low[u]:
+                        low[u] = low[v]
+
+                if low[v] == order[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = False
+                        component_of[w] = len(components)
+                        component.append(w)
+                        if w == v:
+                            break
+                    component.sort()
+                    components.append(component)
+
+        self._components = (components, component_of)
+        return self._components
+
+    def removal_groups(self, packages=None, show_all=False, recursive=True):
+        '''Returns the list of waves from `iter_removal_groups`.
+        '''
+        return list(self.iter_removal_groups(packages, show_all, recursive))
+
+    def iter_removal_groups(self, packages=None, show_all=False,
+                            recursive=True):
+        '''Finds the packages that can be removed.
+
+        Packages that depend on each other are grouped by their strongly
+        connected component, so a cycle of packages that's only used within
+        itself can be removed as a group. The first wave contains the groups
+        of `packages` that have no dependants outside of the group. Each
+        following wave contains the groups of the previous wave's
+        dependencies that no longer have dependants once the previous waves
+        are removed. If `recursive` is false, only the first wave is found.
+
+        Yields each wave as it's found. A wave is a list of groups in the
+        order they were found, and each group is a list of PyModules.
+        '''
+        components, component_of = self.components()
+
+        if packages is None:
+            packages = self.nodes
+
+        seen = set()
+        candidates = []
+        for i in self.indexes(packages):
+            c = component_of[i]
+            if c not in seen:
+                seen.add(c)
+                candidates.append(c)
+
+        in_degree = [0] * len(components)
+        for i, deps in enumerate(self.dependencies):
+            c = component_of[i]
+            for j in deps:
+                if component_of[j] != c:
+                    in_degree[component_of[j]] += 1
+
+        while True:
+            wave = []
+            for c in candidates:
+                if in_degree[c]:
+                    continue
+                for i in components[c]:
+                    if not self.is_removable(i, show_all):
+                        break
+                else:
+                    wave.append(c)
+
+            if not wave:
+                break
+
+            yield [[self.nodes[i] for i in components[c]] for c in wave]
+            if not recursive:
+                break
+
+            seen = set()
+            candidates = []
+            for c in wave:
+                for i in components[c]:
+                    for j in self.dependencies[i]:
+                        d = component_of[j]
+                        if d == c:
+                            continue
+                        in_degree[d] -= 1
+                        if d not in seen:
+                            seen.add(d)
+                            candidates.append(d)
+
+    def removal_waves(self, packages=None, show_all=False, recursive=True):
+        '''Same as `removal_groups`, but each wave is a flat list of
+        PyModules.
+        '''
+        return [[pym for group in wave for pym in group]
+                for wave in self.removal_groups(packages, show_all, recursive)]
+
+    def reachability(self):
+        '''Returns the graph's `Reachability` index. It's only built once.
+        '''
+        if self._reachability is None:
+            self._reachability = Reachability(self)
+        return self._reachability
+
+
+def iter_bits(bits):
+    '''Yields the indexes of the set bits in an integer, lowest first.
+    '''
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class Reachability(object):
+    '''Transitive closure of a DependencyGraph stored as bitsets.
+
+    Bit `j` of `descendants[i]` is set if node `i` depends on node `j`
+    directly or indirectly. `ancestors` is the reverse. Every node is its own
+    descendant and ancestor. Nodes in the same strongly connected component
+    share the same bitsets. `roots` has the bits of the scanned modules set.
+    '''
+    def __init__(self, graph):
+        self.graph = graph
+        components, component_of = graph.components()
+
+        self.roots = 0
+        for i, pym in enumerate(graph.nodes):
+            if pym.is_scan:
+                self.roots |= 1 << i
+
+        # Components are ordered so that dependencies come first
+        reach = [0] * len(components)
+        for c, component in enumerate(components):
+            bits = 0
+            for i in component:
+                bits |= 1 << i
+                for j in graph.dependencies[i]:
+                    if component_of[j] != c:
+                        bits |= reach[component_of[j]]
+            reach[c] = bits
+        self.descendants = [reach[c] for c in component_of]
+
+        reach = [0] * len(components)
+        for c in range(len(components) - 1, -1, -1):
+            bits = 0
+            for i in components[c]:
+                bits |= 1 << i
+                for j in graph.dependants[i]:
+                    if component_of[j] != c:
+                        bits |= reach[component_of[j]]
+            reach[c] = bits
+        self.ancestors = [reach[c] for c in component_of]
+
+    def _index(self, pym):
+        return self.graph.index[id(pym)]
+
+    def _modules(self, bits):
+        return [self.graph.nodes[i] for i in iter_bits(bits)]
+
+    def depends_on(self, pym, dep):
+        '''Whether or not `pym` needs `dep` directly or indirectly.
+        '''
+        return bool(self.descendants[self._index(pym)] >> self._index(dep) & 1)
+
+    def is_used(self, pym):
+        '''Whether or not a scanned module needs `pym`.
+        '''
+        return bool(self.ancestors[self._index(pym)] & self.roots)
+
+    def used_by(self, pym):
+        '''Returns the scanned modules that need `pym`.
+        '''
+        i = self._index(pym)
+        return self._modules(self.ancestors[i] & self.roots & ~(1 << i))
+
+    def why(self, pym):
+        '''Returns the direct dependants of `pym` that are needed by a
+        scanned module, which are the reasons it's installed.
+        '''
+        return [self.graph.nodes[j]
+                for j in self.graph.dependants[self._index(pym)]
+                if self.ancestors[j] & self.roots]
+
+    def orphans(self, pym):
+        '''Returns the modules that would no longer be needed by anything if
+        `pym` were removed.
+
+        These are the dependencies of `pym` that can't be reached without
+        going through `pym`. Only the edges around the dependencies of `pym`
+        are visited.
+        '''
+        i = self._index(pym)
+        reach = self.descendants[i]
+        graph = self.graph
+
+        # Dependencies that are used by something outside of `reach` are
+        # kept, along with everything they depend on.
+        kept = 1 << i
+        stack = []
+        for j in iter_bits(reach & ~kept):
+            for d in graph.dependants[j]:
+                if not reach >> d & 1:
+                    kept |= 1 << j
+                    stack.append(j)
+                    break
+
+        while stack:
+            for k in graph.dependencies[stack.pop()]:
+                if not kept >> k & 1:
+                    kept |= 1 << k
+                    stack.append(k)
+
+        return self._modules(reach & ~kept)
+
+
+def _requires(pym):
+    # Dependencies without dependants come first, like they always have
+    for dep in pym.dependencies:
+        if not dep.dependants:
+            yield dep
+    for dep in pym.dependencies:
+        yield dep
+
+
+def dependency_order(roots, visited=None):
+    '''Yields the `roots` and everything they depend on, with each module
+    after its dependencies. Dependencies are visited in the order they're
+    listed, so the order is deterministic.
+
+    Each module is only visited once, which also breaks cycles. `visited` can
+    be a set of module ids to skip, and it's updated with the ids of the
+    yielded modules.
+    '''
+    if visited is None:
+        visited = set()
+
+    for root in roots:
+        if id(root) in visited:
+            continue
+        visited.add(id(root))
+        stack = [(root, _requires(root))]
+
+        while stack:
+            pym, deps = stack[-1]
+            for dep in deps:
+                if id(dep) not in visited:
+                    visited.add(id(dep))
+                    stack.append((dep, _requires(dep)))
+                    break
+            else:
+                stack.pop()
+                yield pym
@@ -8,6 +8,7 @@ from .utils import running_under_virtualenv
 from .color import *
 from .exceptions import MoultCommandError
 from .compat import str_
+from .graph import dependency_order
 from . import __version__
 
 
@@ -111,24 +112,14 @@ def require_string(pym):
 
 
 def print_requires(pkg, show_all=False, printed=None):
-    if printed is None:
-        printed = set()
-
-    for dep in pkg.dependencies:
-        if not dep.dependants:
-            print_requires(dep, show_all=show_all, printed=printed)
-
-    for dep in pkg.dependencies:
-        print_requires(dep, show_all=show_all, printed=printed)
-
-    if pkg in printed:
-        return
-
-    printed.add(pkg)
-    if not pkg.is_scan:
-        if pkg.missing:
-            output('#', end=' ')
-        output(require_string(pkg))
+    '''Prints the requirements of a package, dependencies first. `printed`
+    is a set of the ids of modules that were already visited.
+    '''
+    for pym in dependency_order((pkg,), printed):
+        if not pym.is_scan:
+            if pym.missing:
+                output('#', end=' ')
+            output(require_string(pym))
 
 
 def print_frozen(scans, show_all=False, printed=None):
@@ -138,7 +129,8 @@ def print_frozen(scans, show_all=False, printed=None):
     date_str = time.strftime('%Y-%m-%d %H:%M:%S %Z', time.localtime())
     output('# Generated with moult {} at {}'.format(__version__, date_str))
 
-    printed = set()
+    if printed is None:
+        printed = set()
     for scan in scans:
         print_requires(scan, show_all=show_all, printed=printed)
 
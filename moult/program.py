@@ -1,23 +1,46 @@
 from __future__ import print_function
 
-from .args import create_argparser
+import os
+import sys
+import multiprocessing
+
+from .args import create_argparser, parse_daemon_args
 from .exceptions import MoultCommandError
-from . import color, printer, filesystem_scanner, utils, log
+from .graph import DependencyGraph, dependency_order
+from . import color, printer, filesystem_scanner, utils, log, cache, stats, \
+    formats
+from . import baseline as baseline_scanner
+from . import watch as watcher
+from . import daemon
+
 
+def moult(packages=None, detail=False, scan=None, local=False, recursive=False,
+          plain=False, show_all=False, freeze=False, no_cache=False,
+          cache_dir=None, jobs=1, threads=False, baseline=None, since=None,
+          watch=False, interval=1.0, output_format='text', **kwargs):
+    out = formats.writer(output_format)
+    try:
+        _moult(out, packages=packages, detail=detail, scan=scan, local=local,
+               recursive=recursive, plain=plain, show_all=show_all,
+               freeze=freeze, no_cache=no_cache, cache_dir=cache_dir,
+               jobs=jobs, threads=threads, baseline=baseline, since=since,
+               watch=watch, interval=interval)
+    finally:
+        if out is not None:
+            out.close()
 
-def more_turtles(packages, show_all=False):
-    remove = []
-    for pym in packages:
-        if not show_all and pym.hidden:
-            continue
-        if not pym.missing and not pym.is_scan and not len(pym._dependants):
-            remove.append(pym)
 
-    return remove
+def _moult(out, packages=None, detail=False, scan=None, local=False,
+           recursive=False, plain=False, show_all=False, freeze=False,
+           no_cache=False, cache_dir=None, jobs=1, threads=False,
+           baseline=None, since=None, watch=False, interval=1.0):
+    cache.enabled = not no_cache
+    if cache_dir:
+        cache.cache_dir = cache_dir
 
+    if jobs < 1:
+        jobs = multiprocessing.cpu_count()
 
-def moult(packages=None, detail=False, scan=None, local=False, recursive=False,
-          plain=False, show_all=False, freeze=False, **kwargs):
     installed = utils.installed_packages(local=local)
 
     if packages is None:
@@ -26,21 +49,64 @@ def moult(packages=None, detail=False, scan=None, local=False, recursive=False,
     if freeze and not scan:
         scan = ['.']
 
+    watchers = []
+
     if scan:
         header_printed = False
 
-        for d in scan:
-            pym = filesystem_scanner.scan(d, installed)
-
-            if not freeze and pym:
-                if not header_printed:
-                    printer.output('Found in scan:', color=color.YAY)
-                    header_printed = True
-                printer.print_module(pym, detail=True, depth=1)
+        if cache.enabled:
+            filesystem_scanner.scan_cache = cache.ScanCache().load()
+
+        saved = None
+        if baseline:
+            saved = baseline_scanner.Baseline(baseline).load()
+
+        try:
+            for d in scan:
+                if watch and not freeze and os.path.isdir(d):
+                    w = watcher.Watcher(d, installed, jobs=jobs,
+                                        threads=threads)
+                    watchers.append(w)
+                    pym = w.pym
+                elif saved is not None and os.path.isdir(d):
+                    pym = baseline_scanner.scan(d, installed, saved, key=d,
+                                                ref=since, jobs=jobs,
+                                                threads=threads)
+                else:
+                    pym = filesystem_scanner.scan(d, installed, jobs=jobs,
+                                                  threads=threads)
+
+                if not freeze and pym and out is not None:
+                    with stats.timer('printer'):
+                        out.module_edges(pym)
+                        out.flush()
+                elif not freeze and pym:
+                    with stats.timer('printer'):
+                        if not header_printed:
+                            printer.output('Found in scan:', color=color.YAY)
+                            header_printed = True
+                        printer.print_module(pym, detail=True, depth=1)
+            if saved is not None:
+                saved.save()
+        finally:
+            if filesystem_scanner.scan_cache is not None:
+                filesystem_scanner.scan_cache.save()
+                filesystem_scanner.scan_cache = None
+
+        fallbacks = stats.get('parse.regex_fallback')
+        if fallbacks:
+            log.info('Files that could not be parsed and only had their'
+                     ' import lines scanned: %d', fallbacks)
 
     if freeze:
         scans = [s for s in installed if s.is_scan]
-        printer.print_frozen(scans, show_all=show_all)
+        with stats.timer('printer'):
+            if out is not None:
+                for pym in dependency_order(scans):
+                    if not pym.is_scan:
+                        out.requirement(pym)
+            else:
+                printer.print_frozen(scans, show_all=show_all)
         return
 
     displaying = []
@@ -63,52 +129,94 @@ def moult(packages=None, detail=False, scan=None, local=False, recursive=False,
 
     if not displaying:
         displaying = installed[:]
+    elif out is not None:
+        with stats.timer('printer'):
+            for pym in displaying:
+                out.module_edges(pym)
     else:
-        printer.output('Matched modules:', color=color.YAY)
-        for pym in displaying:
-            printer.print_module(pym, detail=True, depth=1)
-        print('')
+        with stats.timer('printer'):
+            printer.output('Matched modules:', color=color.YAY)
+            for pym in displaying:
+                printer.print_module(pym, detail=True, depth=1)
+            print('')
+
+    if out is not None:
+        graph = DependencyGraph(installed)
+        waves = graph.iter_removal_groups(displaying, show_all, recursive)
+        for i, groups in enumerate(waves):
+            with stats.timer('printer'):
+                for j, group in enumerate(groups):
+                    for pym in group:
+                        out.removable(pym, i, j)
+                out.flush()
+
+        if watchers:
+            watcher.watch(watchers, installed, interval=interval,
+                          show_all=show_all, out=out)
+        return
 
-    removable = more_turtles(displaying, show_all)
-    if not removable:
+    with stats.timer('removal'):
+        graph = DependencyGraph(installed)
+        waves = graph.removal_groups(displaying, show_all, recursive)
+    if not waves:
         printer.output('Nothing to remove', color=color.YAY, end='\n\n')
-        return
 
-    if removable:
-        i = 0
+    for i, groups in enumerate(waves):
+        if not i:
+            printer.output('Packages that can be removed:', color=color.YAY)
+        else:
+            printer.output('Then you could remove:', color=color.YAY)
 
-        while len(removable):
-            if not i:
-                printer.output('Packages that can be removed:', color=color.YAY)
-            else:
-                printer.output('Then you could remove:', color=color.YAY)
+        with stats.timer('printer'):
+            for group in groups:
+                if plain:
+                    for pym in group:
+                        print(printer.module_string(pym, plain=True), end=' ')
+                    continue
 
-            next_packages = []
+                depth = 1
+                if len(group) > 1:
+                    printer.output('These are only used by each other:',
+                                   indent=1, color=color.MEH)
+                    depth = 2
 
-            for pym in removable:
-                if plain:
-                    print(printer.module_string(pym, plain=True), end=' ')
-                else:
-                    printer.print_module(pym, detail=detail, depth=1)
+                for pym in group:
+                    printer.print_module(pym, detail=detail, depth=depth)
 
-                for dep in pym.dependencies:
-                    dep.remove_dependant(pym)
-                    if dep not in next_packages:
-                        next_packages.append(dep)
+        if plain:
+            print('\n')
+        else:
+            print('')
+
+    if watchers:
+        watcher.watch(watchers, installed, interval=interval,
+                      show_all=show_all)
 
-            if plain:
-                print('\n')
-            else:
-                print('')
 
-            if not recursive:
-                break
+def run_daemon(argv):
+    args = parse_daemon_args(argv)
 
-            removable = more_turtles(next_packages, show_all)
-            i += 1
+    try:
+        return daemon.main(args)
+    except MoultCommandError as e:
+        log.fatal('Error: %s', e)
+    except KeyboardInterrupt:
+        pass
+    return 1
+
+
+def is_daemon_command(argv):
+    '''Checks if the arguments are for `moult daemon` or `moult query`. A
+    file or directory with the same name is scanned instead, like it was
+    before the commands existed.
+    '''
+    return argv[:1] in (['daemon'], ['query']) and not os.path.exists(argv[0])
 
 
 def run():
+    if is_daemon_command(sys.argv[1:]):
+        return run_daemon(sys.argv[1:])
+
     parser = create_argparser()
     args = parser.parse_args()
 
@@ -122,10 +230,15 @@ def run():
         log.set_level(0)
         color.enabled = False
 
+    if args.output_format != 'text':
+        color.enabled = False
+
+    stats.enabled = bool(args.profile or args.profile_json)
     exit_code = 0
 
     try:
-        moult(**vars(args))
+        with stats.timer('total'):
+            moult(**vars(args))
     except MoultCommandError as e:
         exit_code = 1
         log.fatal('Error: %s', e)
@@ -134,8 +247,15 @@ def run():
         import getpass
         print('\n{}, eat a snickers'.format(getpass.getuser()))
     finally:
-        if not utils.running_under_virtualenv():
+        if args.output_format == 'text' and \
+                not utils.running_under_virtualenv():
             printer.output('/!\\ You are not in a Virtual Environment /!\\',
                            color=color.MAN)
 
+    if args.profile:
+        stats.report()
+
+    if args.profile_json:
+        stats.write_json(args.profile_json)
+
     return exit_code
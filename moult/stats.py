@@ -0,0 +1,129 @@
+'''Counters and timers for work done during a run.
+'''
+from __future__ import print_function
+
+import sys
+import json
+import functools
+from timeit import default_timer
+from contextlib import contextmanager
+
+
+# Nothing is recorded unless this is True, which is only needed when the
+# results are reported.
+enabled = False
+
+counters = {}
+timers = {}
+
+
+class _NullTimer(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_null_timer = _NullTimer()
+
+
+def incr(name, n=1):
+    '''Increments a counter. This isn't synchronized, so counts from
+    concurrent threads are approximate.
+    '''
+    if enabled:
+        counters[name] = counters.get(name, 0) + n
+
+
+def get(name):
+    return counters.get(name, 0)
+
+
+def add_time(name, seconds, calls=1):
+    t = timers.get(name)
+    if t is None:
+        timers[name] = [calls, seconds]
+    else:
+        t[0] += calls
+        t[1] += seconds
+
+
+@contextmanager
+def _timer(name):
+    start = default_timer()
+    try:
+        yield
+    finally:
+        add_time(name, default_timer() - start)
+
+
+def timer(name):
+    '''Context manager that adds the time spent in its block to a timer.
+    '''
+    if not enabled:
+        return _null_timer
+    return _timer(name)
+
+
+def timed(name):
+    '''Decorator version of `timer`.
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            with _timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def reset():
+    counters.clear()
+    timers.clear()
+
+
+def snapshot():
+    return {
+        'timers': dict((k, {'calls': v[0], 'seconds': v[1]})
+                       for k, v in timers.items()),
+        'counters': dict(counters),
+    }
+
+
+def merge(data):
+    '''Adds the results of a snapshot taken in another process.
+    '''
+    for name, t in data.get('timers', {}).items():
+        add_time(name, t['seconds'], t['calls'])
+    for name, n in data.get('counters', {}).items():
+        incr(name, n)
+
+
+def report(fp=None):
+    '''Prints a summary of the timers and counters.
+    '''
+    if fp is None:
+        fp = sys.stderr
+
+    width = max([len(x) for x in list(timers) + list(counters)] + [5])
+
+    print('Profile:', file=fp)
+    print('  {:<{w}} {:>10} {:>12}'.format('phase', 'calls', 'seconds',
+                                           w=width), file=fp)
+    for name, (calls, seconds) in sorted(timers.items(), key=lambda x: -x[1][1]):
+        print('  {:<{w}} {:>10d} {:>12.4f}'.format(name, calls, seconds,
+                                                   w=width), file=fp)
+
+    if counters:
+        print('', file=fp)
+        print('  {:<{w}} {:>10}'.format('counter', 'count', w=width), file=fp)
+        for name, n in sorted(counters.items()):
+            print('  {:<{w}} {:>10d}'.format(name, n, w=width), file=fp)
+
+
+def write_json(filename):
+    with open(filename, 'w') as fp:
+        json.dump(snapshot(), fp, indent=2, sort_keys=True)
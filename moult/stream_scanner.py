@@ -0,0 +1,357 @@
+'''Reads imports from files that are too big to parse.
+
+The file is read in chunks and split into tokens as it's read, so memory use
+doesn't depend on the size of the file. Only the tokens of statements that
+could be imports are kept until the end of the statement, and the rest of
+the other statements is skipped over. The contents of strings are dropped
+unless they're short.
+
+`import` and `from` statements are found anywhere, including in indented
+blocks and after the colon of a compound statement. `__import__` and
+`import_module` calls are only read if they're statements whose arguments
+are strings or names. The scope only has the names that statements assign
+to, and only strings assigned to names are kept as values.
+'''
+from __future__ import unicode_literals
+
+import io
+import re
+import ast
+
+from .ast_scanner import ImportNodeVisitor, programmatic_imports
+from .exceptions import MoultScannerError
+from . import log, stats
+
+
+chunk_size = 1024 * 64
+
+# Longest string that's kept for __import__ or import_module arguments
+max_string_size = 1024
+
+# Tokens that are kept for statements that might be calls or assignments
+_max_statement_tokens = 64
+
+_token_re = re.compile(br'''
+    (?P<space>[ \t\f]+)|
+    (?P<continuation>\\(?:\r\n|\r|\n))|
+    (?P<newline>\r\n|\r|\n)|
+    (?P<comment>\#)|
+    (?P<string>[rRuUbBfF]{0,2}(?:\'\'\'|"""|'|"))|
+    (?P<name>[a-zA-Z_\x80-\xff][a-zA-Z0-9_\x80-\xff]*)|
+    (?P<number>[0-9][0-9a-zA-Z_]*)|
+    (?P<op>[\s\S])
+''', re.VERBOSE)
+
+_line_end_re = re.compile(br'[\r\n]')
+
+# Matches escapes, the end of the line for single quoted strings, and runs
+# of quotes for triple quoted strings.
+_string_end_re = {
+    b"'": re.compile(br"\\(?:\r\n|[\s\S])?|'|[\r\n]"),
+    b'"': re.compile(br'\\(?:\r\n|[\s\S])?|"|[\r\n]'),
+    b"'''": re.compile(br"\\(?:\r\n|[\s\S])?|'{1,3}"),
+    b'"""': re.compile(br'\\(?:\r\n|[\s\S])?|"{1,3}'),
+}
+
+# Runs of anything but brackets, comments, line continuations and strings
+# that could span lines. `_skip_re` also stops at the tokens that can end a
+# statement.
+_short_string = br'''"(?!"")(?:[^"\\\r\n]|\\.)*"|'(?!'')(?:[^'\\\r\n]|\\.)*\''''
+_skip_re = re.compile(br'''(?:[^'"\#\\()\[\]{}\r\n;:]+|''' + _short_string + b')+')
+_skip_nested_re = re.compile(br'''(?:[^'"\#\\()\[\]{}]+|''' + _short_string + b')+')
+
+_compound_keywords = frozenset((b'if', b'elif', b'else', b'try', b'except',
+                                b'finally', b'for', b'while', b'with', b'def',
+                                b'class', b'async'))
+
+
+def _chunks(fp, digest=None):
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            break
+        if digest is not None:
+            digest.update(chunk)
+        yield chunk
+
+
+class _Tokenizer(object):
+    '''Yields (type, value) tuples for the tokens in an iterable of byte
+    chunks. Strings are yielded with a (prefix, quote, contents) tuple, and
+    the contents are None if the string is longer than `max_string_size`.
+    Comments and line continuations are left out.
+
+    A token that reaches the end of a chunk is carried over to the next one,
+    except for comments, whitespace and strings which are read in pieces.
+
+    `depth` is the number of open brackets. While `skip` is True, only the
+    tokens that could end the statement or change the depth are yielded.
+    '''
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.depth = 0
+        self.skip = False
+
+    def __iter__(self):
+        chunks = iter(self.chunks)
+        buf = b''
+        in_comment = False
+        string = None
+        eof = False
+
+        while not eof:
+            chunk = next(chunks, b'')
+            eof = not chunk
+            buf += chunk
+            end = len(buf)
+            pos = 0
+
+            # Skipped strings can't span lines, so skipping stops at the end
+            # of the last complete line.
+            line_end = end if eof else buf.rfind(b'\n') + 1
+
+            while pos < end:
+                if in_comment:
+                    m = _line_end_re.search(buf, pos)
+                    if m is None:
+                        pos = end
+                        break
+                    in_comment = False
+                    pos = m.start()
+                    continue
+
+                if string is not None:
+                    prefix, quote, parts, size = string
+                    m = _string_end_re[quote].search(buf, pos)
+                    if m is None or (m.end() == end and not eof):
+                        stop = end if m is None else m.start()
+                        size += stop - pos
+                        if size <= max_string_size:
+                            parts.append(buf[pos:stop])
+                        string = (prefix, quote, parts, size)
+                        pos = stop
+                        break
+
+                    text = m.group()
+                    if text != quote and text not in (b'\r', b'\n'):
+                        # Escapes and quotes that don't end the string
+                        size += m.end() - pos
+                        if size <= max_string_size:
+                            parts.append(buf[pos:m.end()])
+                        string = (prefix, quote, parts, size)
+                        pos = m.end()
+                        continue
+
+                    size += m.start() - pos
+                    if size <= max_string_size:
+                        parts.append(buf[pos:m.start()])
+                    contents = b''.join(parts) if size <= max_string_size else None
+                    yield 'string', (prefix, quote, contents)
+                    string = None
+                    pos = m.end() if text == quote else m.start()
+                    continue
+
+                if self.skip and pos < line_end:
+                    skip_re = _skip_nested_re if self.depth else _skip_re
+                    m = skip_re.match(buf, pos, line_end)
+                    if m is not None:
+                        pos = m.end()
+                        continue
+
+                # Enough has to be left to tell a triple quote from an empty
+                # string
+                if end - pos < 6 and not eof:
+                    break
+
+                m = _token_re.match(buf, pos)
+                kind = m.lastgroup
+                if m.end() == end and not eof and kind != 'space':
+                    break
+                pos = m.end()
+
+                if kind == 'comment':
+                    in_comment = True
+                elif kind == 'string':
+                    text = m.group()
+                    quote = text.lstrip(b'rRuUbBfF')
+                    string = (text[:len(text) - len(quote)], quote, [], 0)
+                elif kind not in ('space', 'continuation'):
+                    text = m.group()
+                    if text in (b'(', b'[', b'{'):
+                        self.depth += 1
+                    elif text in (b')', b']', b'}'):
+                        self.depth = max(self.depth - 1, 0)
+                    yield kind, text
+
+            buf = buf[pos:]
+
+        yield 'newline', b''
+
+
+def _value(token, scope):
+    '''Returns the value of a string or a name in the same way as
+    `ast_scanner.ast_value`.
+    '''
+    kind, value = token
+    if kind == 'name':
+        name = value.decode('utf8')
+        if name in ('True', 'False'):
+            return name == 'True'
+        return scope.get(name)
+    if kind != 'string':
+        raise MoultScannerError('Call with non-constant arguments')
+
+    prefix, quote, contents = value
+    if contents is None or b'f' in prefix.lower():
+        raise MoultScannerError('Call with non-constant arguments')
+    return ast.literal_eval((prefix + quote + contents + quote).decode('utf8'))
+
+
+def _dotted_name(tokens):
+    '''Joins names and dots into a dotted name. Returns the name and the
+    number of tokens it used.
+    '''
+    parts = []
+    for i, (kind, value) in enumerate(tokens):
+        if value == b'.':
+            parts.append(value)
+        elif kind == 'name' and value not in (b'import', b'as') \
+                and (not parts or parts[-1] == b'.'):
+            parts.append(value)
+        else:
+            return b''.join(parts).decode('utf8'), i
+    return b''.join(parts).decode('utf8'), len(tokens)
+
+
+def _split(tokens):
+    '''Splits tokens on commas, leaving out parentheses.
+    '''
+    parts = [[]]
+    for token in tokens:
+        if token[1] == b',':
+            parts.append([])
+        elif token[1] not in (b'(', b')'):
+            parts[-1].append(token)
+    return [x for x in parts if x]
+
+
+def _import_statement(tokens, visitor):
+    if tokens[0][1] == b'import':
+        for part in _split(tokens[1:]):
+            visitor.add_import((_dotted_name(part)[0], ''))
+        return
+
+    module, n = _dotted_name(tokens[1:])
+    if n + 1 >= len(tokens) or tokens[n + 1][1] != b'import':
+        raise MoultScannerError('Incomplete from import')
+    for part in _split(tokens[n + 2:]):
+        visitor.add_import((module, part[0][1].decode('utf8')))
+
+
+def _statement(tokens, visitor, complete=True):
+    '''Adds the imports and assigned names in a statement's tokens to
+    `visitor`. Values and calls are only read if `complete` is True.
+    '''
+    first = tokens[0][1]
+    if first in (b'import', b'from'):
+        _import_statement(tokens, visitor)
+        return
+
+    if first == b'del':
+        for part in _split(tokens[1:]):
+            if len(part) == 1 and part[0][0] == 'name':
+                visitor.scope.pop(part[0][1].decode('utf8'), None)
+        return
+
+    i = 0
+    targets = []
+    while i + 1 < len(tokens) and tokens[i][0] == 'name' \
+            and tokens[i + 1][1] == b'=':
+        if i + 2 < len(tokens) and tokens[i + 2][1] == b'=':
+            break
+        targets.append(tokens[i][1].decode('utf8'))
+        i += 2
+
+    if targets:
+        value = None
+        if complete and i == len(tokens) - 1:
+            try:
+                value = _value(tokens[i], visitor.scope)
+            except (MoultScannerError, ValueError, SyntaxError):
+                pass
+        for name in targets:
+            visitor.scope[name] = value
+        return
+
+    name, n = _dotted_name(tokens)
+    if not complete or not name.endswith(('__import__', 'import_module')):
+        return
+    if len(tokens) < n + 2 or tokens[n][1] != b'(' or tokens[-1][1] != b')':
+        return
+
+    args = []
+    for part in _split(tokens[n + 1:-1]):
+        if len(part) != 1:
+            raise MoultScannerError('Call with non-constant arguments')
+        args.append(_value(part[0], visitor.scope))
+    visitor.add_import(*programmatic_imports(name, args, {}))
+
+
+def _scan_tokens(tokens, visitor):
+    '''Groups the tokens from a `_Tokenizer` into simple statements and
+    scans the ones that could be imports or assignments. The rest of a
+    statement is skipped once it can't be one.
+    '''
+    first = None
+    statement = []
+    collect = False
+    complete = True
+
+    for kind, value in tokens:
+        if tokens.depth == 0 and (kind == 'newline' or value == b';' or (
+                value == b':' and first in _compound_keywords)):
+            if statement:
+                try:
+                    _statement(statement, visitor, complete)
+                except (MoultScannerError, ValueError, SyntaxError) as e:
+                    log.debug('%s, File: %s', e, visitor.filename)
+            first = None
+            statement = []
+            complete = True
+            tokens.skip = False
+            continue
+
+        if kind == 'newline':
+            continue
+
+        if first is None:
+            first = value
+            collect = kind == 'name' and first not in _compound_keywords
+
+        if not collect:
+            tokens.skip = True
+        elif first in (b'import', b'from') \
+                or len(statement) < _max_statement_tokens:
+            statement.append((kind, value))
+        else:
+            collect = False
+            complete = False
+            tokens.skip = True
+
+
+def stream_scan_file(filename, digest=None):
+    '''Scans a file for imports without loading all of it. Returns the same
+    tuple as `ast_scanner.ast_scan_file`, and adds the file's contents to
+    `digest` in the same way.
+    '''
+    visitor = ImportNodeVisitor(filename)
+    try:
+        with stats.timer('stream'):
+            with io.open(filename, 'rb') as fp:
+                _scan_tokens(_Tokenizer(_chunks(fp, digest)), visitor)
+    except IOError:
+        log.warn('Could not open file: %s', filename)
+        return None, None
+
+    log.debug('Streamed imports from: %s', filename)
+    return visitor.scope, visitor.imports
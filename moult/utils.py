@@ -1,42 +1,53 @@
 import os
 import re
 import sys
+import hashlib
+import functools
+import threading
 
-from .classes import PyModule
-from .pip_importer import *
+from .classes import PyModule, PackageIndex
+from .distributions import *
+from .distributions import site_packages_state, Distribution
 from .compat import str_
+from . import stats, cache
 
 _stdlib = set()
 _import_paths = []
+_import_paths_lock = threading.Lock()
+_import_files = {}
+_packages = {}
 
 
 __all__ = ('dist_is_local', 'dist_in_usersite', 'get_installed_distributions',
-           'running_under_virtualenv', 'ignore_packages',
-           'search_packages_info', 'find_package')
+           'running_under_virtualenv', 'ignore_packages', 'find_package')
 
 
-def load_stdlib():
-    '''Scans sys.path for standard library modules.
+def import_paths():
+    '''Returns the absolute paths in sys.path. The paths are collected the
+    first time this is called, which can happen in several threads at once
+    when scanning with `--threads`.
     '''
-    if _stdlib:
-        return _stdlib
+    if not _import_paths:
+        with _import_paths_lock:
+            if not _import_paths:
+                _import_paths.extend([os.path.abspath(sp) for sp in sys.path
+                                      if sp])
+    return _import_paths
+
 
+def _scan_stdlib():
+    '''Scans sys.path for standard library modules.
+    '''
     prefixes = tuple({os.path.abspath(p) for p in (
         sys.prefix,
         getattr(sys, 'real_prefix', sys.prefix),
         getattr(sys, 'base_prefix', sys.prefix),
     )})
 
-    for sp in sys.path:
-        if not sp:
-            continue
-        _import_paths.append(os.path.abspath(sp))
-
-    stdpaths = tuple({p for p in _import_paths
+    stdpaths = tuple({p for p in import_paths()
                       if p.startswith(prefixes) and 'site-packages' not in p})
 
-    _stdlib.update(sys.builtin_module_names)
-
+    modules = set()
     for stdpath in stdpaths:
         if not os.path.isdir(stdpath):
             continue
@@ -49,12 +60,39 @@ def load_stdlib():
             if not os.path.isdir(p) and not item.endswith(('.py', '.so')):
                 continue
 
-            _stdlib.add(item.split('.', 1)[0])
+            modules.add(item.split('.', 1)[0])
 
-    return _stdlib
+    return modules
 
 
-load_stdlib()
+def load_stdlib():
+    '''Loads the names of standard library modules the first time it's
+    called.
+
+    The interpreter's own list is used if it has one (Python 3.10+).
+    Otherwise, the stdlib directories are scanned and the results are cached
+    for the interpreter.
+    '''
+    if _stdlib:
+        return _stdlib
+
+    modules = set(sys.builtin_module_names)
+
+    if hasattr(sys, 'stdlib_module_names'):
+        modules.update(sys.stdlib_module_names)
+    else:
+        interpreter = repr((sys.prefix, sys.version)).encode('utf8')
+        cache_name = 'stdlib-{}.json'.format(hashlib.sha1(interpreter).hexdigest()[:12])
+        cached = cache.load_json(cache_name)
+        if isinstance(cached, list):
+            modules.update(cached)
+        else:
+            scanned = _scan_stdlib()
+            modules.update(scanned)
+            cache.save_json(cache_name, sorted(scanned))
+
+    _stdlib.update(modules)
+    return _stdlib
 
 
 def is_stdlib(module):
@@ -66,20 +104,38 @@ def is_import_str(text):
     return re.match(r'^[\w\.]+$', text) and re.match(r'\w+\.\w+', text)
 
 
+def _package(dirname):
+    '''Returns a tuple of the package path parts and the root directory for
+    a directory. Results are remembered for each directory, and the number
+    of `__init__.py` checks is counted in the `package.probes` stat.
+    '''
+    package = _packages.get(dirname)
+    if package is not None:
+        stats.incr('package.memo_hits')
+        return package
+
+    stats.incr('package.probes')
+    if os.path.isfile(os.path.join(dirname, '__init__.py')):
+        parent, tail = os.path.split(dirname)
+        parts, root = _package(parent) if parent != dirname else ((), parent)
+        package = (parts + (tail,), root)
+    else:
+        package = ((), dirname)
+
+    _packages[dirname] = package
+    return package
+
+
 def import_path_from_file(filename, as_list=False):
     '''Returns a tuple of the import path and root module directory for the
     supplied file.
     '''
-    module_path = []
+    parts, dirname = _package(os.path.dirname(filename))
+    module_path = list(parts)
     basename = os.path.splitext(os.path.basename(filename))[0]
     if basename != '__init__':
         module_path.append(basename)
 
-    dirname = os.path.dirname(filename)
-    while os.path.isfile(os.path.join(dirname, '__init__.py')):
-        dirname, tail = os.path.split(dirname)
-        module_path.insert(0, tail)
-
     if as_list:
         return module_path, dirname
     return '.'.join(module_path), dirname
@@ -87,24 +143,51 @@ def import_path_from_file(filename, as_list=False):
 
 def file_containing_import(import_path, import_root):
     '''Finds the file that might contain the import_path.
+
+    Results are remembered for each import path and root. The number of
+    filesystem checks is counted in the `file_containing_import.probes`
+    stat.
     '''
-    if not _import_paths:
-        load_stdlib()
-
-    if os.path.isfile(import_root):
-        import_root = os.path.dirname(import_root)
-
-    search_paths = [import_root] + _import_paths
-    module_parts = import_path.split('.')
-    for i in range(len(module_parts), 0, -1):
-        module_path = os.path.join(*module_parts[:i])
-        for sp in search_paths:
-            p = os.path.join(sp, module_path)
-            if os.path.isdir(p):
-                return os.path.join(p, '__init__.py')
-            elif os.path.isfile(p + '.py'):
-                return p + '.py'
-    return None
+    key = (import_path, import_root)
+    if key in _import_files:
+        stats.incr('file_containing_import.memo_hits')
+        return _import_files[key]
+
+    found = None
+    probes = 1
+
+    with stats.timer('file_containing_import'):
+        if os.path.isfile(import_root):
+            import_root = os.path.dirname(import_root)
+
+        search_paths = [import_root] + import_paths()
+        module_parts = import_path.split('.')
+        for i in range(len(module_parts), 0, -1):
+            module_path = os.path.join(*module_parts[:i])
+            for sp in search_paths:
+                p = os.path.join(sp, module_path)
+                probes += 1
+                if os.path.isdir(p):
+                    found = os.path.join(p, '__init__.py')
+                    break
+                probes += 1
+                if os.path.isfile(p + '.py'):
+                    found = p + '.py'
+                    break
+            if found:
+                break
+
+    stats.incr('file_containing_import.probes', probes)
+    _import_files[key] = found
+    return found
+
+
+def clear_import_cache():
+    '''Forgets the files found by `file_containing_import` and the packages
+    found by `import_path_from_file`.
+    '''
+    _import_files.clear()
+    _packages.clear()
 
 
 def resolve_import(import_path, from_module):
@@ -136,6 +219,10 @@ def find_package(name, installed, package=False):
 
     If `package` is true, match package names, otherwise, match import paths.
     '''
+    stats.incr('find_package.calls')
+    if isinstance(installed, PackageIndex):
+        return installed.find(name, package)
+
     if package:
         name = name.lower()
         tests = (
@@ -195,41 +282,119 @@ def is_python_script(filename):
     return False
 
 
-def iter_dist_files(dist):
-    if dist.has_metadata('RECORD'):
-        for line in dist.get_metadata_lines('RECORD'):
-            line = line.split(',')[0]
-            if line.endswith('.pyc'):
-                continue
-            yield os.path.normpath(os.path.join(dist.location, line))
-    elif dist.has_metadata('installed-files.txt'):
-        for line in dist.get_metadata_lines('installed-files.txt'):
-            if line.endswith('.pyc'):
-                continue
-            yield os.path.normpath(os.path.join(dist.location,
-                                                dist.egg_info, line))
+# Version of the records written by _dump_installed
+_record_format = 2
 
 
+def _dump_installed(installed):
+    '''Serializes the installed package graph for the cache. Installed files
+    that haven't been loaded yet are stored as the distribution's metadata
+    location so they can still be loaded lazily.
+    '''
+    indexes = dict((id(x), i) for i, x in enumerate(installed))
+    records = []
+    for pym in installed:
+        if pym.files_loaded:
+            files = [pym.installed_scripts, pym.installed_files]
+        else:
+            dist = pym._files_loader.args[0]
+            files = [dist.metadata_path, dist.kind]
+        records.append([pym.name, pym.version, pym.location, pym.import_names,
+                        pym.local, pym.user, pym._hidden, pym.missing, files,
+                        pym._dependencies,
+                        [indexes[id(x)] for x in pym.dependencies]])
+    return records
+
+
+def _load_installed(records):
+    installed = PackageIndex()
+
+    for record in records:
+        name, version, location, import_names, local, user, hidden, \
+            missing, files, dependencies, _ = record
+        pym = PyModule(name, version, location, missing=missing)
+        pym.import_names = import_names
+        pym.local = local
+        pym.user = user
+        pym.hidden = hidden
+        if isinstance(files[0], list):
+            pym.installed_scripts, pym.installed_files = files
+        else:
+            dist = Distribution(name, version, location, *files)
+            pym.set_files_loader(functools.partial(_installed_files, dist))
+        pym._dependencies = dependencies
+        installed.append(pym)
+
+    # Link in the same order as installed_packages() to get the same
+    # dependant order.
+    for pym, record in zip(list(installed), records):
+        for i in record[-1]:
+            pymc = installed[i]
+            pymc.add_dependant(pym)
+            pym.add_dependency(pymc)
+
+    return installed
+
+
+@stats.timed('installed_packages')
 def installed_packages(local=False):
-    installed = []
+    '''Returns a PackageIndex of installed packages with their dependencies
+    linked.
 
-    for dist in get_installed_distributions(local_only=local):
+    The result is cached until the contents of the directories in sys.path
+    change.
+    '''
+    env = repr((sys.prefix, sys.executable)).encode('utf8')
+    cache_name = 'installed-{}.json'.format(hashlib.sha1(env).hexdigest()[:12])
+    key = 'local' if local else 'all'
+    state = site_packages_state()
+
+    data = cache.load_json(cache_name)
+    if not isinstance(data, dict) or data.get('state') != state \
+            or data.get('format') != _record_format:
+        data = {'state': state, 'format': _record_format}
+    elif key in data:
+        stats.incr('installed_packages.cache_hits')
+        return _load_installed(data[key])
+
+    installed = _installed_packages(local)
+    data[key] = _dump_installed(installed)
+    cache.save_json(cache_name, data)
+
+    return installed
+
+
+def _installed_files(dist):
+    '''Returns a tuple of the scripts and other files that a distribution
+    installed outside of its location.
+    '''
+    scripts = []
+    files = []
+    for filename in dist.load(('files',)).files:
+        if not filename.startswith(dist.location):
+            if is_script(filename):
+                scripts.append(filename)
+            else:
+                files.append(filename)
+    return scripts, files
+
+
+def _installed_packages(local=False):
+    installed = PackageIndex()
+
+    dists = get_installed_distributions(local_only=local,
+                                        fields=('requires', 'top_level'))
+    for dist in dists:
         pym = PyModule(dist.project_name, dist.version, dist.location)
-        if dist.has_metadata('top_level.txt'):
-            pym.set_import_names(list(dist.get_metadata_lines('top_level.txt')))
+        if dist.top_level is not None:
+            pym.set_import_names(dist.top_level)
 
         pym.local = dist_is_local(dist)
         pym.user = dist_in_usersite(dist)
-        pym._dependencies = [dep.project_name for dep in dist.requires()]
-
-        for filename in iter_dist_files(dist):
-            if not filename.startswith(dist.location):
-                if is_script(filename):
-                    pym.installed_scripts.append(filename)
-                else:
-                    pym.installed_files.append(filename)
+        pym._dependencies = list(dist.requires)
+        pym.set_files_loader(functools.partial(_installed_files, dist))
 
-        if pym.installed_scripts or pym.name in ignore_packages:
+        if pym.name in ignore_packages:
             pym.hidden = True
 
         installed.append(pym)
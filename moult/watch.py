@@ -0,0 +1,231 @@
+'''Keeps the scans of directories up to date as their files change.
+
+Each watched directory's files and their imports are kept in memory in the
+same format as a baseline entry. Changes are found by polling the
+modification times of the files and directories. Once a burst of changes
+settles, only the touched files are scanned again and the scanned module's
+dependencies are updated with the imports that were added or removed.
+'''
+from __future__ import print_function, unicode_literals
+
+import os
+import time
+
+from .graph import DependencyGraph
+from . import baseline, filesystem_scanner, printer, color, utils, log
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime)
+
+
+class Watcher(object):
+    '''Scans a directory and keeps its PyModule's dependencies in sync with
+    the files in it.
+
+    `counts` maps the ids of dependencies to the number of import
+    statements that refer to them. A dependency is only removed when no
+    file imports it anymore.
+    '''
+    def __init__(self, directory, installed, jobs=1, threads=False):
+        self.directory = os.path.abspath(directory)
+        self.installed = installed
+        self.entry = baseline.create_entry(self.directory, jobs, threads)
+        self.pym = filesystem_scanner.scan_module(self.directory, installed)
+        self.counts = {}
+        self.changed = set()
+        self.deleted = set()
+        self._signature = None
+
+        touched = {}
+        for rel in sorted(self.entry['files']):
+            self._count(self.entry['files'][rel][2], 1, touched)
+        self._link(touched)
+
+    def _count(self, items, n, touched):
+        for imp_type, import_path in items:
+            dep = utils.find_package(import_path, self.installed)
+            if not dep:
+                continue
+
+            key = id(dep)
+            if key not in touched:
+                touched[key] = (dep, self.counts.get(key, 0))
+            self.counts[key] = self.counts.get(key, 0) + n
+
+            if n > 0 and imp_type != 'import':
+                self.pym.add_framework(imp_type)
+
+    def _link(self, touched):
+        '''Adds or removes the edges of the dependencies whose counts went
+        from or to zero. Returns the dependencies that were added and
+        removed.
+        '''
+        added = []
+        removed = []
+        for key, (dep, before) in touched.items():
+            after = self.counts.get(key, 0)
+            if after <= 0:
+                self.counts.pop(key, None)
+                if before > 0:
+                    self.pym.remove_dependency(dep)
+                    dep.remove_dependant(self.pym)
+                    removed.append(dep)
+            elif before <= 0:
+                dep.add_dependant(self.pym)
+                self.pym.add_dependency(dep)
+                added.append(dep)
+        return added, removed
+
+    def poll(self):
+        '''Checks for changes. The changes are collected until a poll finds
+        nothing new, so a burst of changes is only scanned once.
+
+        Returns True if there are changes that are ready to be applied.
+        '''
+        changed, deleted = baseline.find_changes(self.directory, self.entry)
+        self.changed -= deleted
+        self.changed |= changed
+        self.deleted -= changed
+        self.deleted |= deleted
+
+        if not self.changed and not self.deleted:
+            return False
+
+        signature = (frozenset(self.deleted),
+                     frozenset((rel, _signature(os.path.join(self.directory, rel)))
+                               for rel in self.changed))
+        settled = signature == self._signature
+        self._signature = signature
+        return settled
+
+    def update(self):
+        '''Applies any changes right away, without waiting for them to
+        settle.
+        '''
+        self.poll()
+        if self.changed or self.deleted:
+            return self.apply()
+        return [], [], []
+
+    def apply(self):
+        '''Scans the changed files and updates the dependencies.
+
+        Returns a tuple of the changed files, and the dependencies that were
+        added and removed.
+        '''
+        files = self.entry['files']
+        changed = sorted(self.changed | self.deleted)
+        old = {}
+
+        for rel in self.deleted:
+            old[rel] = files.pop(rel, (0, 0, []))[2]
+
+        # Files that were found through a changed file, like Django apps,
+        # are scanned again too.
+        utils.clear_import_cache()
+        for rel in sorted(self.changed):
+            results = baseline.scan_file(os.path.join(self.directory, rel))
+            for filename in results:
+                r = os.path.relpath(filename, self.directory)
+                if r not in old:
+                    old[r] = files[r][2] if r in files else []
+            baseline.record(self.directory, self.entry, results)
+
+        touched = {}
+        for items in old.values():
+            self._count(items, -1, touched)
+        for rel in old:
+            if rel in files:
+                self._count(files[rel][2], 1, touched)
+
+        self.changed = set()
+        self.deleted = set()
+        self._signature = None
+
+        added, removed = self._link(touched)
+        return changed, added, removed
+
+
+def used_packages(installed):
+    '''Returns the ids of the packages that are needed by a scanned module.
+    '''
+    reach = DependencyGraph(installed).reachability()
+    return set(id(pym) for pym in installed
+               if not pym.is_scan and reach.is_used(pym))
+
+
+def print_changes(watcher, changed, added, unused):
+    printer.output(time.strftime('[%H:%M:%S]'), 'Changes in',
+                   printer.file_string(watcher.directory),
+                   '({} files)'.format(len(changed)), color=color.YAY)
+
+    if added:
+        printer.output('New imports:', indent=1, color=color.HEY)
+        for pym in sorted(added, key=lambda x: x.name.lower()):
+            printer.output(printer.module_string(pym), indent=2)
+
+    if unused:
+        printer.output('No longer used:', indent=1, color=color.MEH)
+        for pym in sorted(unused, key=lambda x: x.name.lower()):
+            printer.output(printer.module_string(pym), indent=2)
+
+    if not added and not unused:
+        printer.output('No dependency changes', indent=1, color=color.NEAT)
+
+    print('')
+
+
+def write_changes(out, watcher, added, unused):
+    for pym in added:
+        out.module(pym)
+        out.write({'type': 'new_import', 'scan': watcher.pym.name,
+                   'name': pym.name})
+    for pym in unused:
+        out.module(pym)
+        out.write({'type': 'unused', 'scan': watcher.pym.name,
+                   'name': pym.name})
+    out.flush()
+
+
+def watch(watchers, installed, interval=1.0, show_all=False, polls=None,
+          out=None):
+    '''Polls the `watchers` every `interval` seconds and prints the packages
+    that were newly imported or are no longer used. This runs until it's
+    interrupted, or for `polls` polls. If `out` is a record writer, the
+    changes are written as records instead.
+    '''
+    used = used_packages(installed)
+    if out is None:
+        printer.output('Watching for changes...', color=color.NEAT,
+                       end='\n\n')
+
+    while polls is None or polls > 0:
+        if polls is not None:
+            polls -= 1
+        time.sleep(interval)
+
+        for watcher in watchers:
+            if not watcher.poll():
+                continue
+
+            changed, added, removed = watcher.apply()
+            log.info('Rescanned %d files in %s', len(changed),
+                     watcher.directory)
+
+            now_used = used_packages(installed)
+            dropped = used - now_used
+            unused = [pym for pym in installed
+                      if id(pym) in dropped and not pym.missing]
+            if not show_all:
+                unused = [pym for pym in unused if not pym.hidden]
+            used = now_used
+
+            if out is not None:
+                write_changes(out, watcher, added, unused)
+            else:
+                print_changes(watcher, changed, added, unused)
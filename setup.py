@@ -48,7 +48,7 @@ setup(
     version=moult.__version__,
     description=description,
     long_description=readme_file('README.md'),
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks']),
     url='https://github.com/tweekmonster/moult',
     install_requires=[],
     entry_points={
@@ -4,13 +4,14 @@ import pytest
 import logging
 
 
-from moult import log
+from moult import log, cache, stats
 from moult.utils import installed_packages
 
 from py._path.local import LocalPath
 
 
 log.set_level(logging.DEBUG)
+cache.enabled = False
 
 
 class ScriptData(object):
@@ -77,3 +78,9 @@ class ScriptData(object):
 @pytest.fixture
 def data(tmpdir):
     return ScriptData(tmpdir)
+
+
+@pytest.fixture
+def profiling(monkeypatch):
+    monkeypatch.setattr(stats, 'enabled', True)
+    stats.reset()
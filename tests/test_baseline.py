@@ -0,0 +1,106 @@
+import os
+import subprocess
+
+import pytest
+
+from moult import baseline, filesystem_scanner
+
+
+def dependency_names(pym):
+    return sorted(x.name for x in pym.dependencies)
+
+
+def bump_mtime(path):
+    st = os.stat(path)
+    os.utime(path, (st.st_atime, st.st_mtime + 10))
+
+
+def test_baseline_scan(data, tmpdir):
+    data_dir = data.copy_data()
+    nested = data_dir.join('scripts/project/nested')
+    saved = baseline.Baseline(str(tmpdir.join('baseline.json')))
+
+    full = filesystem_scanner.scan(str(nested), data.copy_installed())
+    pym = baseline.scan(str(nested), data.copy_installed(), saved, key='nested')
+    assert dependency_names(pym) == dependency_names(full)
+    saved.save()
+
+    def no_parsing(filename, *args, **kwargs):
+        raise AssertionError('Unchanged file was parsed: %s' % filename)
+
+    saved = baseline.Baseline(saved.filename).load()
+    assert 'nested' in saved.roots
+    scan_file = filesystem_scanner._scan_file
+    filesystem_scanner._scan_file = no_parsing
+    try:
+        pym = baseline.scan(str(nested), data.copy_installed(), saved,
+                            key='nested')
+    finally:
+        filesystem_scanner._scan_file = scan_file
+    assert dependency_names(pym) == dependency_names(full)
+
+    # Changed, added, and deleted files
+    spam = nested.join('scripts/testmodule/utils/spam.py')
+    spam.write('import moult\n')
+    bump_mtime(str(spam))
+    new_dir = nested.join('scripts/newmodule')
+    new_dir.mkdir().join('eggs.py').write('import setuptools\n')
+    bump_mtime(str(nested.join('scripts')))
+
+    pym = baseline.scan(str(nested), data.copy_installed(), saved, key='nested')
+    assert dependency_names(pym) == ['moult', 'setuptools']
+
+    new_dir.remove()
+    pym = baseline.scan(str(nested), data.copy_installed(), saved, key='nested')
+    assert dependency_names(pym) == ['moult']
+
+
+def git(directory, *args):
+    return subprocess.call(('git', '-c', 'user.name=moult',
+                            '-c', 'user.email=moult@example.com') + args,
+                           cwd=str(directory), stdout=subprocess.PIPE,
+                           stderr=subprocess.PIPE)
+
+
+def commit_all(directory):
+    try:
+        if git(directory, 'init') or git(directory, 'add', '.') \
+                or git(directory, 'commit', '-m', 'init'):
+            pytest.skip('git is not usable')
+    except OSError:
+        pytest.skip('git is not installed')
+
+
+def test_git_changes_are_filtered(tmpdir):
+    tmpdir.join('main.py').write('import os\n')
+    commit_all(tmpdir)
+
+    tmpdir.join('main.py').write('import moult\n')
+    tmpdir.mkdir('.tox').join('setup.py').write('import setuptools\n')
+    tmpdir.mkdir('build').join('notes.bak').write('import setuptools\n')
+
+    entry = {'files': {}, 'directories': {}}
+    changed, deleted = baseline.find_changes(str(tmpdir), entry, 'HEAD')
+    assert changed == set(['main.py'])
+    assert not deleted
+
+
+def test_git_renames_and_deletes(data, tmpdir):
+    project = tmpdir.mkdir('project')
+    project.join('a.py').write('import moult\n')
+    project.join('b.py').write('import os\n')
+    commit_all(project)
+    project.join('c.py').write('import setuptools\n')
+
+    saved = baseline.Baseline(str(tmpdir.join('baseline.json')))
+    pym = baseline.scan(str(project), data.copy_installed(), saved,
+                        key='project', ref='HEAD')
+    assert dependency_names(pym) == ['moult', 'setuptools']
+
+    # A renamed file and a deleted untracked file
+    assert not git(project, 'mv', 'a.py', 'a_old.txt')
+    project.join('c.py').remove()
+    pym = baseline.scan(str(project), data.copy_installed(), saved,
+                        key='project', ref='HEAD')
+    assert sorted(saved.roots['project']['files']) == ['b.py']
+    assert dependency_names(pym) == []
@@ -0,0 +1,116 @@
+import os
+
+import pytest
+
+from moult import cache, filesystem_scanner, utils
+
+
+@pytest.fixture
+def cache_dir(tmpdir, monkeypatch):
+    d = tmpdir.mkdir('cache')
+    monkeypatch.setattr(cache, 'cache_dir', str(d))
+    monkeypatch.setattr(cache, 'enabled', True)
+    return d
+
+
+def test_scan_cache_entries(tmpdir, cache_dir):
+    script = tmpdir.join('script.py')
+    script.write('import os\n')
+    filename = str(script)
+
+    scan_cache = cache.ScanCache()
+    assert scan_cache.get(filename, os.stat(filename), 'script') is None
+
+    scan_cache.set(filename, os.stat(filename), 'script', ['spam'], ['os'])
+    assert scan_cache.get(filename, os.stat(filename), 'script') == (['spam'], ['os'])
+
+    # Same contents with a different mtime
+    st = os.stat(filename)
+    os.utime(filename, (st.st_atime, st.st_mtime - 100))
+    assert scan_cache.get(filename, os.stat(filename), 'script') == (['spam'], ['os'])
+
+    # Same size with different contents
+    script.write('import re\n')
+    os.utime(filename, (st.st_atime, st.st_mtime - 200))
+    assert scan_cache.get(filename, os.stat(filename), 'script') is None
+
+    script.write('import sys\n')
+    assert scan_cache.get(filename, os.stat(filename), 'script') is None
+
+    # Same file in a different package
+    scan_cache.set(filename, os.stat(filename), 'script', ['spam'], ['sys'])
+    assert scan_cache.get(filename, os.stat(filename), 'pkg.script') is None
+
+
+def test_scan_cache_persistence(tmpdir, cache_dir):
+    script = tmpdir.join('script.py')
+    script.write('import os\n')
+    filename = str(script)
+
+    scan_cache = cache.ScanCache()
+    scan_cache.set(filename, os.stat(filename), 'script', [], ['os'])
+    assert scan_cache.save()
+    assert not scan_cache.save(), 'Clean caches should not be written'
+
+    scan_cache = cache.ScanCache().load()
+    assert scan_cache.get(filename, os.stat(filename), 'script') == ([], ['os'])
+
+    cache.enabled = False
+    assert not len(cache.ScanCache().load())
+
+
+def test_scan_cache_eviction(tmpdir, cache_dir):
+    scan_cache = cache.ScanCache(max_entries=2)
+    for i in range(4):
+        script = tmpdir.join('script{}.py'.format(i))
+        script.write('import os\n')
+        scan_cache.set(str(script), os.stat(str(script)), script.purebasename,
+                       [], ['os'])
+        scan_cache.entries[str(script)][3] = i
+
+    assert scan_cache.evict() == 2
+    assert sorted(scan_cache.entries) == [str(tmpdir.join('script2.py')),
+                                          str(tmpdir.join('script3.py'))]
+
+
+def test_cached_scan(data, cache_dir, monkeypatch):
+    installed = data.copy_installed()
+    data_dir = data.copy_data()
+    nested = str(data_dir.join('scripts/project/nested'))
+
+    monkeypatch.setattr(filesystem_scanner, 'scan_cache', cache.ScanCache())
+    pkg = filesystem_scanner.scan(nested, installed)
+    assert len(filesystem_scanner.scan_cache)
+    filesystem_scanner.scan_cache.save()
+
+    def no_parsing(filename, *args, **kwargs):
+        raise AssertionError('Cached file was parsed: %s' % filename)
+
+    installed = data.copy_installed()
+    monkeypatch.setattr(filesystem_scanner, 'ast_scan_file', no_parsing)
+    monkeypatch.setattr(filesystem_scanner, 'scan_cache', cache.ScanCache().load())
+    cached_pkg = filesystem_scanner.scan(nested, installed)
+
+    assert [x.name for x in cached_pkg.dependencies] \
+        == [x.name for x in pkg.dependencies]
+    for p in ('moult', 'setuptools', 'testpackage'):
+        assert utils.find_package(p, installed, True) in cached_pkg.dependencies
+
+
+def test_cached_relative_imports(tmpdir, cache_dir, monkeypatch):
+    pkg = tmpdir.mkdir('pkg')
+    pkg.join('__init__.py').write('')
+    module = pkg.join('module.py')
+    module.write('from . import spam\n')
+    filename = str(module)
+
+    monkeypatch.setattr(filesystem_scanner, 'scan_cache', cache.ScanCache())
+    imports = filesystem_scanner._file_imports(filename, os.stat(filename))[1]
+    assert imports == ['pkg.spam']
+
+    # The cached imports were resolved in a package that's gone now. Packages
+    # are remembered until the import cache is cleared, like a new run would.
+    pkg.join('__init__.py').remove()
+    utils.clear_import_cache()
+    imports = filesystem_scanner._file_imports(filename, os.stat(filename))[1]
+    assert imports != ['pkg.spam']
@@ -15,3 +15,41 @@ def test_repr():
     repr(c2)
     repr(c3)
     repr(c4)
+
+
+def test_module_edges():
+    pkg = PyModule('pkg', '1.0')
+    assert not pkg.dependants
+
+    others = [PyModule('a', '1.0'), PyModule('scan1', 'SCRIPT'),
+              PyModule('b', '1.0'), PyModule('scan2', 'DIRECTORY')]
+    for pym in others + others:
+        pkg.add_dependant(pym)
+
+    # Scans first with the most recent first, then everything else in order
+    assert [x.name for x in pkg.dependants] == ['scan2', 'scan1', 'a', 'b']
+    assert others[0] in pkg.dependants
+    assert PyModule('a', '1.0') not in pkg.dependants
+
+    pkg.remove_dependant(others[1])
+    assert [x.name for x in pkg.dependants] == ['scan2', 'a', 'b']
+    assert others[1] not in pkg.dependants
+
+
+def test_lazy_files():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return ['/bin/script'], ['/share/file']
+
+    pkg = PyModule('pkg', '1.0')
+    pkg.set_files_loader(loader)
+    assert not pkg.files_loaded
+    assert pkg.hidden
+    assert pkg.installed_scripts == ['/bin/script']
+    assert pkg.installed_files == ['/share/file']
+    assert len(calls) == 1
+
+    pkg.hidden = False
+    assert not pkg.hidden
@@ -0,0 +1,125 @@
+import os
+import socket
+import threading
+
+import pytest
+
+from moult import daemon, program, utils
+from moult.args import parse_daemon_args
+from moult.distributions import site_packages_state
+
+
+def test_query_args():
+    args = parse_daemon_args(['query', 'removable', '-r', 'a', 'b'])
+    assert args.recursive
+    assert args.paths == ['a', 'b']
+
+    args = parse_daemon_args(['query', 'scan', 'a', '--no-daemon', 'b'])
+    assert args.no_daemon
+    assert args.paths == ['a', 'b']
+
+    with pytest.raises(SystemExit):
+        parse_daemon_args(['query', 'scan', 'a', '--bogus', 'b'])
+    with pytest.raises(SystemExit):
+        parse_daemon_args(['daemon', 'a'])
+
+
+def test_daemon_command(tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    assert program.is_daemon_command(['query', 'ping'])
+    assert program.is_daemon_command(['daemon'])
+    assert not program.is_daemon_command(['scan'])
+    assert not program.is_daemon_command([])
+
+    # Existing paths named like the commands are scanned
+    tmpdir.mkdir('query')
+    assert not program.is_daemon_command(['query', 'ping'])
+
+
+def make_state(data, max_scans=None):
+    state = daemon.State(max_scans=max_scans)
+    state.site_state = site_packages_state(utils.import_paths())
+    state.installed = data.copy_installed()
+    return state
+
+
+def names(records):
+    return sorted(x['name'] for x in records)
+
+
+def test_handle(data):
+    data_dir = data.copy_data()
+    nested = data_dir.join('scripts/project/nested')
+    state = make_state(data)
+
+    response = daemon.handle(state, {'command': 'scan',
+                                     'paths': [str(nested)]})
+    assert response['ok']
+    assert names(response['result'][0]['dependencies']) == [
+        'moult', 'setuptools', 'testpackage']
+
+    spam = nested.join('scripts/testmodule/utils/spam.py')
+    spam.write('import moult\n')
+    response = daemon.handle(state, {'command': 'freeze',
+                                     'paths': [str(nested)]})
+    assert response['ok']
+    assert [x.split('==')[0] for x in response['result']] == ['moult']
+
+    response = daemon.handle(state, {'command': 'scan',
+                                     'paths': [str(data_dir.join('nope'))]})
+    assert not response['ok']
+
+    response = daemon.handle(state, {'command': 'nope'})
+    assert not response['ok']
+
+
+def test_scan_eviction(data):
+    data_dir = data.copy_data()
+    project = data_dir.join('scripts/project')
+    state = make_state(data, max_scans=1)
+    count = len(state.installed)
+
+    first = state.scan(str(project.join('nested')))
+    assert first in state.installed
+    second = state.scan(str(data_dir.join('scripts/loose/obvious_script.py')))
+    assert len(state.scans) == 1
+    assert first not in state.installed
+    assert second in state.installed
+    assert len(state.installed) == count + 1
+
+    setuptools = utils.find_package('setuptools', state.installed)
+    assert first not in setuptools.dependants
+
+
+@pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'),
+                    reason='Unix sockets are not supported')
+def test_serve(data, tmpdir, monkeypatch):
+    monkeypatch.setattr(daemon, 'client_timeout', 0.2)
+    socket_path = str(tmpdir.join('moult.sock'))
+    thread = threading.Thread(target=daemon.serve, args=(socket_path,))
+    thread.daemon = True
+    thread.start()
+
+    for _ in range(100):
+        response = daemon.send_request(socket_path, {'command': 'ping'})
+        if response is not None:
+            break
+        thread.join(0.05)
+
+    assert response['ok']
+    assert not os.stat(socket_path).st_mode & 0o077
+
+    # A client that never sends its request doesn't block the others
+    stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stalled.connect(socket_path)
+    try:
+        response = daemon.send_request(socket_path, {'command': 'ping'},
+                                       timeout=5)
+        assert response['ok']
+    finally:
+        stalled.close()
+    assert daemon.send_request(socket_path, {'command': 'stop'})['ok']
+    thread.join(5)
+    assert not thread.is_alive()
+    assert not tmpdir.join('moult.sock').exists()
+    assert daemon.send_request(socket_path, {'command': 'ping'}) is None
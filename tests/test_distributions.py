@@ -0,0 +1,67 @@
+from moult import distributions
+
+
+def test_evaluate_marker():
+    env = {'python_version': '2.7', 'sys_platform': 'linux2', 'extra': ''}
+    evaluate = distributions.evaluate_marker
+
+    assert evaluate('python_version < "3"', env)
+    assert not evaluate('python_version >= "3.4"', env)
+    assert evaluate('python_version == "2.7" and sys_platform == "linux2"', env)
+    assert evaluate('(python_version < "2.6" or python_version > "2.6")', env)
+    assert not evaluate('extra == "security"', env)
+    assert evaluate('"linux" in sys_platform', env)
+    assert evaluate('python_version ~= "2.7"', env)
+    assert evaluate('this is not a marker', env)
+
+
+def test_read_distributions(tmpdir):
+    site = tmpdir.mkdir('site-packages')
+
+    dist_info = site.mkdir('Spam_Eggs-1.2.dist-info')
+    dist_info.join('METADATA').write(
+        'Metadata-Version: 2.0\n'
+        'Name: Spam-Eggs\n'
+        'Version: 1.2\n'
+        'Requires-Dist: bacon (>=1.0)\n'
+        'Requires-Dist: ham; python_version < "2"\n'
+        'Requires-Dist: cheese[smelly]; extra == "dairy"\n'
+        'Requires-Dist: toast\n'
+        '\n'
+        'Requires-Dist: not-a-header\n')
+    dist_info.join('top_level.txt').write('spam\neggs\n')
+    dist_info.join('RECORD').write(
+        'spam/__init__.py,,\n'
+        'spam/__init__.pyc,,\n'
+        '../bin/spam,,\n')
+
+    egg_info = site.mkdir('bacon-2.0-py2.7.egg-info')
+    egg_info.join('PKG-INFO').write('Name: bacon\nVersion: 2.0\n')
+    egg_info.join('requires.txt').write(
+        'lettuce\n\n'
+        '[:python_version < "2"]\nham\n\n'
+        '[crispy]\noil\n')
+
+    site.join('wsgiref.egg-info').write('Name: wsgiref\nVersion: 0.1.2\n')
+
+    dists = distributions.get_installed_distributions(local_only=False,
+                                                      paths=[str(site)])
+    assert [x.project_name for x in dists] == ['Spam-Eggs', 'bacon']
+
+    spam, bacon = dists
+    assert spam.version == '1.2'
+    assert spam.location == str(site)
+    assert spam.requires == ['bacon', 'toast']
+    assert spam.top_level == ['spam', 'eggs']
+    assert spam.files == [str(site.join('spam/__init__.py')),
+                          str(tmpdir.join('bin/spam'))]
+
+    assert bacon.version == '2.0'
+    assert bacon.requires == ['lettuce']
+    assert bacon.top_level is None
+    assert bacon.files == []
+
+    dists = distributions.get_installed_distributions(
+        local_only=False, paths=[str(site)], fields=('top_level',))
+    assert dists[0].top_level == ['spam', 'eggs']
+    assert dists[0].requires is None and dists[0].files is None
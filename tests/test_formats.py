@@ -0,0 +1,56 @@
+import io
+import json
+
+from moult import formats
+
+from .test_graph import make_packages
+
+
+def write_records(writer):
+    scan, a, b, c, d, e, f, g, h = make_packages()
+    writer.module_edges(scan)
+    writer.module_edges(c)
+    writer.removable(b, 0, 0)
+    writer.requirement(g)
+    writer.close()
+
+
+def test_ndjson():
+    fp = io.StringIO()
+    write_records(formats.RecordWriter(fp))
+    records = [json.loads(x) for x in fp.getvalue().splitlines()]
+
+    assert [(x['type'], x.get('name')) for x in records] == [
+        ('module', 'project'),
+        ('module', 'a'),
+        ('edge', None),
+        ('module', 'c'),
+        ('module', 'd'),
+        ('edge', None),
+        ('module', 'g'),
+        ('edge', None),
+        ('module', 'b'),
+        ('edge', None),
+        ('removable', 'b'),
+        ('requirement', 'g'),
+    ]
+    edges = [(x['from'], x['to']) for x in records if x['type'] == 'edge']
+    assert edges == [('project', 'a'), ('c', 'd'), ('c', 'g'), ('b', 'c')]
+    assert records[0]['scan']
+    assert records[6]['missing']
+    assert records[-1] == {'type': 'requirement', 'name': 'g',
+                           'version': '1.0', 'missing': True}
+
+
+def test_json():
+    ndjson = io.StringIO()
+    write_records(formats.RecordWriter(ndjson))
+    fp = io.StringIO()
+    write_records(formats.JSONArrayWriter(fp))
+
+    records = json.loads(fp.getvalue())
+    assert records == [json.loads(x) for x in ndjson.getvalue().splitlines()]
+
+    fp = io.StringIO()
+    formats.JSONArrayWriter(fp).close()
+    assert json.loads(fp.getvalue()) == []
@@ -0,0 +1,152 @@
+from moult.classes import PyModule
+from moult.graph import DependencyGraph, dependency_order
+
+
+def link(pym, *deps):
+    for dep in deps:
+        dep.add_dependant(pym)
+        pym.add_dependency(dep)
+
+
+def make_packages():
+    scan = PyModule('project', 'DIRECTORY', '/project')
+    names = 'abcdefgh'
+    a, b, c, d, e, f, g, h = [PyModule(x, '1.0') for x in names]
+    h.hidden = True
+    g.missing = True
+
+    link(scan, a)
+    link(a, d)
+    link(b, c)
+    link(c, d, g)
+    link(e, f)
+    link(h, f)
+
+    return [scan, a, b, c, d, e, f, g, h]
+
+
+def test_removal_waves():
+    packages = make_packages()
+    graph = DependencyGraph(packages)
+
+    waves = graph.removal_waves(packages)
+    assert [[x.name for x in w] for w in waves] == [['b', 'e'], ['c']]
+
+    waves = graph.removal_waves(packages, show_all=True)
+    assert [[x.name for x in w] for w in waves] == [['b', 'e', 'h'], ['c', 'f']]
+
+    waves = graph.removal_waves(packages, recursive=False)
+    assert [[x.name for x in w] for w in waves] == [['b', 'e']]
+
+    # Waves only start from the supplied packages
+    waves = graph.removal_waves(packages[2:3] * 2)
+    assert [[x.name for x in w] for w in waves] == [['b'], ['c']]
+
+    # The PyModules are left alone
+    assert [x.name for x in packages[4].dependants] == ['a', 'c']
+    assert [[x.name for x in w] for w in graph.removal_waves(packages)] \
+        == [['b', 'e'], ['c']]
+
+
+def test_unlisted_nodes():
+    packages = make_packages()
+    graph = DependencyGraph(packages[4:5])
+    assert sorted(x.name for x in graph.nodes) \
+        == ['a', 'b', 'c', 'd', 'g', 'project']
+    waves = graph.removal_waves()
+    assert [[x.name for x in w] for w in waves] == [['b'], ['c']]
+
+
+def test_removable_cycles():
+    packages = make_packages()
+    scan, a, b, c, d = packages[:5]
+    x, y, z, w = [PyModule(n, '1.0') for n in 'xyzw']
+    link(x, y, w)
+    link(y, x)
+    link(z, z)
+
+    # A cycle that's used by a scan is never removable
+    link(a, b)
+    link(c, a)
+
+    packages.extend((x, y, z, w))
+    graph = DependencyGraph(packages)
+
+    components, component_of = graph.components()
+    assert component_of[graph.index[id(x)]] == component_of[graph.index[id(y)]]
+    assert component_of[graph.index[id(a)]] == component_of[graph.index[id(c)]]
+
+    waves = graph.removal_groups(packages)
+    assert [[[p.name for p in g] for g in w] for w in waves] \
+        == [[['e'], ['x', 'y'], ['z']], [['w']]]
+    assert [[p.name for p in w] for w in graph.removal_waves(packages)] \
+        == [['e', 'x', 'y', 'z'], ['w']]
+
+
+def test_deep_components():
+    chain = [PyModule('p{}'.format(i), '1.0') for i in range(5000)]
+    for p1, p2 in zip(chain, chain[1:]):
+        link(p1, p2)
+    link(chain[-1], chain[0])
+
+    graph = DependencyGraph(chain)
+    components, _ = graph.components()
+    assert len(components) == 1
+    assert graph.removal_waves() == [chain]
+
+
+def test_reachability():
+    packages = make_packages()
+    scan, a, b, c, d, e, f, g, h = packages
+    x, y = PyModule('x', '1.0'), PyModule('y', '1.0')
+    link(b, x)
+    link(x, y)
+    link(y, x)
+    packages.extend((x, y))
+
+    graph = DependencyGraph(packages)
+    reach = graph.reachability()
+    assert reach is graph.reachability()
+
+    assert reach.depends_on(scan, d)
+    assert reach.depends_on(b, g)
+    assert not reach.depends_on(d, a)
+
+    assert reach.is_used(d)
+    assert not reach.is_used(c)
+    assert reach.used_by(d) == [scan]
+    assert reach.used_by(scan) == []
+    assert [p.name for p in reach.why(d)] == ['a']
+
+    # d is still used by a, and x and y are only used by each other
+    assert sorted(p.name for p in reach.orphans(b)) == ['c', 'g', 'x', 'y']
+    assert reach.orphans(c) == [g]
+    assert reach.orphans(e) == []
+    assert reach.orphans(a) == []
+    assert reach.orphans(scan) == [a]
+
+
+def test_dependency_order():
+    packages = make_packages()
+    scan, a, b, c, d = packages[:5]
+    link(scan, c)
+    x, y = PyModule('x', '1.0'), PyModule('y', '1.0')
+    link(c, x)
+    link(x, y)
+    link(y, x)
+
+    order = [p.name for p in dependency_order([scan, b])]
+    assert order == ['d', 'a', 'g', 'y', 'x', 'c', 'project', 'b']
+
+    visited = set()
+    assert list(dependency_order([c], visited))[-1] is c
+    assert [p.name for p in dependency_order([scan], visited)] \
+        == ['a', 'project']
+
+
+def test_deep_dependency_order():
+    chain = [PyModule('p{}'.format(i), '1.0') for i in range(5000)]
+    for p1, p2 in zip(chain, chain[1:]):
+        link(p1, p2)
+
+    assert list(dependency_order(chain[:1])) == chain[::-1]
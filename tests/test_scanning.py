@@ -1,9 +1,10 @@
 # coding: utf8
+import os
 import sys
 
 import pytest
 
-from moult import filesystem_scanner, utils
+from moult import ast_scanner, filesystem_scanner, utils, stats
 from moult.classes import PyModule
 
 
@@ -179,3 +180,376 @@ def test_unicode_import_scan(data, capsys):
         assert japanesu.name in err
     elif sys.version_info[0] == 3:
         assert japanesu in installed
+
+
+def test_parallel_scan(data):
+    data_dir = data.copy_data()
+
+    installed = data.copy_installed()
+    pkg = filesystem_scanner.scan(str(data_dir), installed)
+
+    parallel_installed = data.copy_installed()
+    parallel_pkg = filesystem_scanner.scan(str(data_dir), parallel_installed,
+                                           jobs=2)
+
+    assert [str(x) for x in parallel_installed] == [str(x) for x in installed]
+    assert [str(x) for x in parallel_pkg.dependencies] \
+        == [str(x) for x in pkg.dependencies]
+    assert parallel_pkg.frameworks == pkg.frameworks
+
+    for a, b in zip(installed, parallel_installed):
+        assert [str(x) for x in a.dependants] == [str(x) for x in b.dependants]
+
+
+def test_parallel_data_dump(tmpdir, monkeypatch):
+    dump = tmpdir.mkdir('dump')
+    for i in range(400):
+        dump.join('data{}.dat'.format(i)).write('')
+    for i in range(10):
+        dump.join('module{}.py'.format(i)).write('import os\n')
+
+    # The modules are listed after the data files
+    list_directory = filesystem_scanner._list_directory
+    monkeypatch.setattr(filesystem_scanner, '_list_directory',
+                        lambda *args: sorted(list_directory(*args),
+                                             key=lambda x: x.name))
+
+    parsed = []
+    scan_file = filesystem_scanner._scan_file
+
+    def tracked(filename, *args, **kwargs):
+        parsed.append(filename)
+        return scan_file(filename, *args, **kwargs)
+
+    monkeypatch.setattr(filesystem_scanner, '_scan_file', tracked)
+    filesystem_scanner.scan(str(tmpdir), [])
+
+    # The prescan only parses the files that a serial scan would
+    collected = list(filesystem_scanner._collect_files(str(tmpdir), set()))
+    assert collected == parsed == []
+
+
+def test_threaded_scan(data):
+    data_dir = data.copy_data()
+
+    installed = data.copy_installed()
+    pkg = filesystem_scanner.scan(str(data_dir), installed)
+
+    threaded_installed = data.copy_installed()
+    threaded_pkg = filesystem_scanner.scan(str(data_dir), threaded_installed,
+                                           jobs=4, threads=True)
+
+    assert [str(x) for x in threaded_pkg.dependencies] \
+        == [str(x) for x in pkg.dependencies]
+
+
+def test_reentrant_scan(data):
+    from multiprocessing.pool import ThreadPool
+
+    data_dir = data.copy_data()
+    scripts = data_dir.join('scripts/project/nested/scripts/testmodule')
+    spam = str(scripts.join('utils/spam.py'))
+    init = str(scripts.join('__init__.py'))
+
+    scope, imports = ast_scanner.ast_scan_file(spam)
+    expected = [x.import_path for x in imports]
+    ast_scanner.ast_scan_file(init)
+    assert [x.import_path for x in imports] == expected, \
+        'Previous scan results changed after another scan'
+
+    pool = ThreadPool(4)
+    try:
+        results = pool.map(ast_scanner.ast_scan_file, [spam, init] * 20)
+    finally:
+        pool.close()
+        pool.join()
+
+    for scope, imports in results[::2]:
+        assert [x.import_path for x in imports] == expected
+
+
+@pytest.mark.skipif(not hasattr(os, 'symlink'), reason='Requires symlinks')
+def test_symlink_loop(data, monkeypatch):
+    installed = data.copy_installed()
+    tmpdir = data.tmpdir.mkdir('loop')
+    tmpdir.join('script.py').write('import moult\n')
+    tmpdir.join('spam').mksymlinkto(tmpdir)
+    tmpdir.join('eggs.py').mksymlinkto(tmpdir.join('script.py'))
+
+    scanned = []
+    scan_file = filesystem_scanner._scan_file
+
+    def tracked_scan_file(filename, *args, **kwargs):
+        for item in scan_file(filename, *args, **kwargs):
+            scanned.append(filename)
+            yield item
+
+    monkeypatch.setattr(filesystem_scanner, '_scan_file', tracked_scan_file)
+    pkg = filesystem_scanner.scan(str(tmpdir), installed)
+    assert utils.find_package('moult', installed, True) in pkg.dependencies
+    assert len(scanned) == 1
+
+
+def test_listdir_fallback(data, monkeypatch):
+    from moult import compat
+
+    data_dir = data.copy_data()
+    installed = data.copy_installed()
+    pkg = filesystem_scanner.scan(str(data_dir), installed)
+
+    monkeypatch.setattr(filesystem_scanner, 'scandir', compat.listdir_scandir)
+    installed = data.copy_installed()
+    fallback_pkg = filesystem_scanner.scan(str(data_dir), installed)
+    assert [str(x) for x in fallback_pkg.dependencies] \
+        == [str(x) for x in pkg.dependencies]
+
+
+def test_scan_stats(data, tmpdir, profiling):
+    data_dir = data.copy_data()
+    project = str(data_dir.join('scripts/project'))
+
+    stats.reset()
+    filesystem_scanner.scan(project, data.copy_installed())
+    serial = stats.snapshot()
+    assert serial['timers']['parse']['calls']
+    assert serial['timers']['walk']['calls']
+    assert serial['timers']['django']['calls'] == 1
+    assert serial['counters']['stat.calls']
+    assert serial['counters']['find_package.calls']
+
+    stats.reset()
+    filesystem_scanner.scan(str(data_dir.join('scripts/loose/bad_tabs.py')),
+                            data.copy_installed())
+    assert stats.get('parse.regex_fallback') == 1
+
+    # Parse stats from worker processes are merged into this process
+    stats.reset()
+    filesystem_scanner.scan(project, data.copy_installed(), jobs=2)
+    assert stats.timers['parse'][0] == serial['timers']['parse']['calls']
+
+    profile = tmpdir.join('profile.json')
+    stats.write_json(str(profile))
+    assert 'parse' in profile.read()
+
+    # Nothing is recorded unless profiling is enabled
+    stats.reset()
+    stats.enabled = False
+    filesystem_scanner.scan(project, data.copy_installed(), jobs=2)
+    assert stats.snapshot() == {'timers': {}, 'counters': {}}
+
+    data.verify_data()
+
+
+def test_pyc_scan(data, tmpdir, profiling):
+    import py_compile
+    from moult import bytecode_scanner
+
+    package = tmpdir.mkdir('pycpkg')
+    package.join('__init__.py').write('')
+    source = package.join('module.py')
+    source.write('\n'.join((
+        'import os, sys',
+        'import xml.dom.minidom as minidom',
+        'from . import sibling',
+        'from .sub import (spam,',
+        '                  eggs)',
+        'from json import *',
+        'import importlib',
+        '__import__("constant_import")',
+        'importlib.import_module("constant_module")',
+        'value = __import__("assigned_import")',
+        'INSTALLED_APPS = []',
+        '',
+        'def function():',
+        '    import nested_import',
+        '',
+        'class Thing(object):',
+        '    from collections import OrderedDict',
+        '',
+    )))
+
+    def imports(result):
+        scope, imports = result
+        return [x.import_path for x in imports]
+
+    assert bytecode_scanner.pyc_scan_file(str(source)) is None
+
+    py_compile.compile(str(source), doraise=True)
+    stats.reset()
+    result = bytecode_scanner.pyc_scan_file(str(source))
+    assert stats.get('pyc.hits') == 1
+    assert imports(result) == imports(ast_scanner.ast_scan_file(str(source)))
+    assert 'INSTALLED_APPS' in result[0]
+
+    # Variables passed to __import__ need the AST to resolve
+    source.write('name = "os"\n__import__(name)\n')
+    py_compile.compile(str(source), doraise=True)
+    assert bytecode_scanner.pyc_scan_file(str(source)) is None
+    assert imports(ast_scanner.ast_scan_file(str(source))) == ['os']
+
+    # Files with code the compiler could remove are parsed
+    for guard in ('if False:', 'if not __debug__:', 'while 0:',
+                  'if x:\n    pass\nelif (0):'):
+        source.write('{}\n    import json\nimport os\n'.format(guard))
+        py_compile.compile(str(source), doraise=True)
+        assert bytecode_scanner.pyc_scan_file(str(source)) is None
+        assert filesystem_scanner._parse_file(str(source))[2] == ['json', 'os']
+
+    source.write('if value:\n    import json\nimport os\n')
+    py_compile.compile(str(source), doraise=True)
+    assert imports(bytecode_scanner.pyc_scan_file(str(source))) \
+        == ['json', 'os']
+
+    # Stale bytecode isn't used
+    source.write('import os\n')
+    st = os.stat(str(source))
+    os.utime(str(source), (st.st_atime, st.st_mtime + 10))
+    assert bytecode_scanner.pyc_scan_file(str(source)) is None
+    assert stats.get('pyc.stale') == 1
+    stats.reset()
+
+
+def test_prefilter(tmpdir, monkeypatch, profiling):
+    data_file = tmpdir.join('data.py')
+    data_file.write('VALUES = [1, 2, 3]\nNAMES = {"a": "important"}\n')
+    literals = tmpdir.join('literals.py')
+    literals.write('VALUES = [1, 2, 3]\n')
+    settings = tmpdir.join('settings.py')
+    settings.write('INSTALLED_APPS = ["app"]\n')
+
+    stats.reset()
+    scope, imports = ast_scanner.ast_scan_file(str(literals))
+    assert (scope, imports) == ({}, [])
+    assert stats.get('prefilter.misses') == 1
+    assert 'parse' not in stats.timers
+
+    scope, imports = ast_scanner.ast_scan_file(str(settings))
+    assert 'INSTALLED_APPS' in scope
+    assert stats.get('prefilter.hits') == 1
+
+    # Big files are searched with mmap before they're read
+    monkeypatch.setattr(ast_scanner, 'mmap_threshold', 0)
+    assert ast_scanner.ast_scan_file(str(literals)) == ({}, [])
+    scope, imports = ast_scanner.ast_scan_file(str(data_file))
+    assert 'VALUES' in scope
+    assert stats.get('prefilter.misses') == 2
+    assert stats.get('prefilter.hits') == 2
+
+    empty = tmpdir.join('empty.py')
+    empty.write('')
+    assert ast_scanner.ast_scan_file(str(empty)) == ({}, [])
+    stats.reset()
+
+
+def test_stream_scan(data, tmpdir, monkeypatch, profiling):
+    from moult import stream_scanner
+
+    source = tmpdir.join('module.py')
+    source.write('\n'.join((
+        '"""Docstring with import fake_docstring"""',
+        'import os, sys',
+        'import xml.dom.minidom as minidom',
+        'from json import (loads,',
+        '                  dumps as d)  # import fake_comment',
+        "VALUES = {'a': [1, 2], 'b': '''",
+        'import fake_string',
+        "'''}",
+        'name = "csv"',
+        '__import__(name)',
+        'importlib.import_module("email")',
+        'value = __import__("assigned_import")',
+        'INSTALLED_APPS = []',
+        '',
+        'def function(a={1: 2}):',
+        '    if a: import nested_import',
+        '    try: from collections import OrderedDict; import array',
+        '    except ImportError: pass',
+        '',
+    )))
+
+    def imports(result):
+        scope, imports = result
+        return [x.import_path for x in imports]
+
+    expected = imports(ast_scanner.ast_scan_file(str(source)))
+    assert 'nested_import' in expected
+
+    for chunk_size in (1, 7, 1024):
+        monkeypatch.setattr(stream_scanner, 'chunk_size', chunk_size)
+        result = stream_scanner.stream_scan_file(str(source))
+        assert imports(result) == expected
+        assert 'INSTALLED_APPS' in result[0]
+
+    # Big files are streamed instead of skipped
+    installed = data.copy_installed()
+    data_dir = data.copy_data()
+    monkeypatch.setattr(filesystem_scanner, 'max_file_size', 0)
+    monkeypatch.setattr(filesystem_scanner, 'pyc_scan_file', lambda *args, **kwargs: None)
+    stats.reset()
+    pkg = filesystem_scanner.scan(str(data_dir), installed)
+    assert stats.timers['stream'][0]
+    assert 'parse' not in stats.timers
+    for p in ('django', 'testpackage', 'boto', 'django-allauth'):
+        assert utils.find_package(p, installed, True) in pkg.dependencies
+    stats.reset()
+
+
+def test_scan_nested_statements(tmpdir):
+    source = tmpdir.join('module.py')
+    source.write('\n'.join((
+        'import os',
+        'name = "json"',
+        'VALUES = {"a": [1, 2.5, None, True], "b": (b"x", u"y")}',
+        'if VALUES:',
+        '    import sys',
+        'else:',
+        '    from xml import dom',
+        'for x in []:',
+        '    pass',
+        'else:',
+        '    __import__(name)',
+        'try:',
+        '    import array',
+        'except ImportError:',
+        '    other = "csv"',
+        'finally:',
+        '    del name',
+        'with open("x") as fp:',
+        '    importlib.import_module(other)',
+        'class Thing(object):',
+        '    def method(self):',
+        '        from . import sibling',
+        '        __import__("email", fromlist=["mime"])',
+        '',
+    )))
+
+    scope, imports = ast_scanner.ast_scan_file(str(source))
+    assert scope['other'] == 'csv'
+    assert scope['VALUES']['b'] == (b'x', 'y')
+    assert [x.import_path for x in imports] == [
+        'os', 'sys', 'xml.dom', 'json', 'array', 'csv', 'sibling',
+        'email.mime']
+
+
+def test_regex_fallback(tmpdir, profiling):
+    lines = (
+        'print "Python 2 only"',
+        'import os, sys',
+        'from xml.dom import (minidom,',
+        '                     pulldom)',
+        '    import json',
+        'x = "not an import"',
+        'from . import sibling',
+    )
+    expected = ['os', 'sys', 'xml.dom.minidom', 'xml.dom.pulldom', 'json',
+                'sibling']
+
+    for newline in ('\n', '\r\n', '\r'):
+        script = tmpdir.join('py2only.py')
+        script.write_binary(newline.join(lines).encode('utf8'))
+
+        stats.reset()
+        scope, imports = ast_scanner.ast_scan_file(str(script))
+        assert [x.import_path for x in imports] == expected
+        assert stats.get('parse.regex_fallback') == 1
+    stats.reset()
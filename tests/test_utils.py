@@ -1,4 +1,6 @@
+import os
 import sys
+from multiprocessing.pool import ThreadPool
 
 import pytest
 
@@ -162,3 +164,152 @@ def test_file_types(data):
     assert not utils.is_python_script(bash_script)
     assert utils.is_script(py_script)
     assert utils.is_python_script(py_script)
+
+
+def test_lazy_import_file(data, profiling):
+    from moult import stats
+    from moult.ast_scanner import ResolvedImport
+
+    data_dir = data.copy_data()
+    filename = str(data_dir.join('scripts/project/nested/scripts/testmodule/utils/spam.py'))
+    root = str(data_dir.join('scripts/project/nested/scripts/testmodule'))
+
+    utils.clear_import_cache()
+    stats.reset()
+
+    imp = ResolvedImport('utils.spam.SomeClass', root)
+    assert stats.get('file_containing_import.probes') == 0
+    assert imp.filename == filename
+    probes = stats.get('file_containing_import.probes')
+    assert probes > 0
+
+    imp = ResolvedImport('utils.spam.SomeClass', root)
+    assert imp.filename == filename
+    assert stats.get('file_containing_import.probes') == probes
+    assert stats.get('file_containing_import.memo_hits') == 1
+
+    assert ResolvedImport('os.path', root).filename is None
+    assert stats.get('file_containing_import.probes') == probes
+
+
+def test_package_index(data):
+    from moult.classes import PackageIndex
+
+    installed = data.copy_installed()
+    assert isinstance(installed, PackageIndex)
+    linear = list(installed)
+
+    for pkg in linear:
+        for name in pkg.import_names:
+            assert utils.find_package(name, installed) \
+                is utils.find_package(name, linear)
+        assert utils.find_package(pkg.name.upper(), installed, True) \
+            is utils.find_package(pkg.name.upper(), linear, True)
+
+    shadow = PyModule('moult', '9.9', '/')
+    shadow.local = True
+    installed.insert(0, shadow)
+    assert utils.find_package('moult', installed, True) is shadow
+    shadow.is_scan = True
+    assert utils.find_package('moult', installed, True) is None
+
+    installed.remove(shadow)
+    pkg = utils.find_package('moult', installed, True)
+    assert pkg and pkg is not shadow
+
+    user_pkg = PyModule('moult', 'USER', '/')
+    user_pkg.user = True
+    installed.append(user_pkg)
+    assert utils.find_package('moult', installed) is user_pkg
+    installed.pop()
+    assert utils.find_package('moult', installed) is pkg
+
+
+def test_installed_packages_cache(tmpdir, monkeypatch, profiling):
+    from moult import cache, stats
+
+    monkeypatch.setattr(cache, 'enabled', True)
+    monkeypatch.setattr(cache, 'cache_dir', str(tmpdir))
+    stats.reset()
+
+    installed = utils.installed_packages()
+    assert not stats.get('installed_packages.cache_hits')
+
+    cached = utils.installed_packages()
+    assert stats.get('installed_packages.cache_hits') == 1
+    assert [str(x) for x in cached] == [str(x) for x in installed]
+
+    # Installed files are still loaded lazily from the cached packages
+    assert not any(x.files_loaded for x in cached if not x.missing)
+
+    for a, b in zip(installed, cached):
+        assert a.import_names == b.import_names
+        assert (a.local, a.user, a.hidden, a.missing) \
+            == (b.local, b.user, b.hidden, b.missing)
+        assert list(a.installed_scripts) == list(b.installed_scripts)
+        assert list(a.installed_files) == list(b.installed_files)
+        assert [str(x) for x in a.dependencies] == [str(x) for x in b.dependencies]
+        assert [str(x) for x in a.dependants] == [str(x) for x in b.dependants]
+
+    assert utils.find_package('moult', cached, True).name == 'moult'
+
+    monkeypatch.setattr(utils, 'site_packages_state', lambda: 'changed')
+    utils.installed_packages()
+    assert stats.get('installed_packages.cache_hits') == 1
+
+
+def test_lazy_stdlib(tmpdir, monkeypatch):
+    from moult import cache
+
+    monkeypatch.setattr(cache, 'enabled', True)
+    monkeypatch.setattr(cache, 'cache_dir', str(tmpdir))
+    monkeypatch.setattr(utils, '_stdlib', set())
+
+    assert utils.is_stdlib('os.path')
+    assert not utils.is_stdlib('moult')
+    stdlib = set(utils._stdlib)
+
+    if not hasattr(sys, 'stdlib_module_names'):
+        assert len(tmpdir.listdir()) == 1, 'stdlib cache was not written'
+
+        def no_scan():
+            raise AssertionError('stdlib was scanned')
+
+        monkeypatch.setattr(utils, '_scan_stdlib', no_scan)
+        monkeypatch.setattr(utils, '_stdlib', set())
+        assert utils.is_stdlib('os.path')
+        assert utils._stdlib == stdlib
+
+
+def test_import_paths_threads(monkeypatch):
+    monkeypatch.setattr(utils, '_import_paths', [])
+    expected = [os.path.abspath(x) for x in sys.path if x]
+
+    pool = ThreadPool(8)
+    try:
+        results = pool.map(lambda _: list(utils.import_paths()), range(32))
+    finally:
+        pool.close()
+        pool.join()
+
+    assert all(x == expected for x in results)
+    assert utils.import_paths() == expected
+
+
+def test_import_path_from_file_memo(tmpdir, profiling):
+    from moult import stats
+
+    sub = tmpdir.mkdir('pkg').mkdir('sub')
+    tmpdir.join('pkg/__init__.py').write('')
+    sub.join('__init__.py').write('')
+
+    utils.clear_import_cache()
+    assert utils.import_path_from_file(str(sub.join('a.py'))) \
+        == ('pkg.sub.a', str(tmpdir))
+    assert stats.get('package.probes') == 3
+    assert utils.import_path_from_file(str(sub.join('b.py'))) \
+        == ('pkg.sub.b', str(tmpdir))
+    assert utils.import_path_from_file(str(sub.join('__init__.py'))) \
+        == ('pkg.sub', str(tmpdir))
+    assert stats.get('package.probes') == 3
+    utils.clear_import_cache()
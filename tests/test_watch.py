@@ -0,0 +1,68 @@
+import os
+
+from moult import watch, utils, program
+
+
+def bump_mtime(path):
+    st = os.stat(path)
+    os.utime(path, (st.st_atime, st.st_mtime + 10))
+
+
+def names(pyms):
+    return sorted(x.name for x in pyms)
+
+
+def settle(watcher):
+    # Changes are only applied once a poll finds nothing new
+    assert not watcher.poll()
+    assert watcher.poll()
+    return watcher.apply()
+
+
+def test_watcher(data):
+    data_dir = data.copy_data()
+    nested = data_dir.join('scripts/project/nested')
+    installed = data.copy_installed()
+    watcher = watch.Watcher(str(nested), installed)
+    assert names(watcher.pym.dependencies) == ['moult', 'setuptools',
+                                               'testpackage']
+    assert not watcher.poll()
+
+    new_dir = nested.join('scripts/newmodule')
+    new_dir.mkdir().join('eggs.py').write('import testpackage\n')
+    bump_mtime(str(nested.join('scripts')))
+
+    changed, added, removed = settle(watcher)
+    assert changed == [os.path.join('scripts', 'newmodule', 'eggs.py')]
+    assert not added
+    assert not removed
+
+    spam = nested.join('scripts/testmodule/utils/spam.py')
+    spam.write('import moult\n')
+    bump_mtime(str(spam))
+
+    changed, added, removed = settle(watcher)
+    assert names(removed) == ['setuptools']
+    setuptools = utils.find_package('setuptools', installed)
+    assert watcher.pym not in setuptools.dependants
+    assert not watcher.poll()
+
+    new_dir.remove()
+    changed, added, removed = settle(watcher)
+    assert names(removed) == ['testpackage']
+    assert names(watcher.pym.dependencies) == ['moult']
+
+    spam.write('import setuptools\n')
+    bump_mtime(str(spam))
+    changed, added, removed = settle(watcher)
+    assert names(added) == ['setuptools']
+    assert names(watcher.pym.dependencies) == ['setuptools']
+    assert watcher.pym in setuptools.dependants
+
+
+def test_watch_without_scan(capsys):
+    # Nothing is watched without scan paths, so this returns right away
+    program.moult(watch=True, no_cache=True)
+    program.moult(packages=['pip'], watch=True, no_cache=True)
+    program.moult(watch=True, no_cache=True, output_format='ndjson')
+    assert 'Watching' not in capsys.readouterr()[0]